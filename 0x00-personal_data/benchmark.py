@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks of the redaction and logging paths of filtered_logger.
+
+Every case runs on seeded synthetic log lines, and on the same lines as
+JSON documents for the JSON-aware path, and prints one JSON object
+per line (ops/sec, p50/p99 ns per line, peak bytes allocated), so that
+two runs can be compared with --compare to catch regressions.
+
+Usage: ./benchmark.py --lines 5000 > run.jsonl
+       ./benchmark.py --compare run.jsonl
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import string
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from filtered_logger import PII_FIELDS, RedactingFormatter
+from filtered_logger import filter_datum, get_logger, redact_json
+
+# (number of fields, length of the values, share of fields to redact)
+CASES = [
+    (5, 8, 0.2),
+    (5, 8, 1.0),
+    (20, 8, 0.25),
+    (20, 64, 0.25),
+    (50, 16, 0.1),
+    (50, 16, 0.5),
+]
+
+
+def make_lines(count: int, n_fields: int, value_len: int, density: float,
+               seed: int) -> Tuple[List[str], List[str]]:
+    """
+    Build synthetic "key=value;" log lines.
+
+    Args:
+        count (int): Number of lines.
+        n_fields (int): Number of fields per line.
+        value_len (int): Length of each value.
+        density (float): Share of the fields of a line that are PII.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        Tuple[List[str], List[str]]: The fields to redact and the lines.
+    """
+    rng = random.Random(seed)
+    n_pii = max(1, round(n_fields * density))
+    pii = ["{}{}".format(PII_FIELDS[i % len(PII_FIELDS)], i)
+           for i in range(n_pii)]
+    other = ["field{}".format(i) for i in range(n_fields - n_pii)]
+    alphabet = string.ascii_letters + string.digits
+    lines = []
+    for _ in range(count):
+        keys = pii + other
+        rng.shuffle(keys)
+        lines.append("".join("{}={};".format(
+            key, "".join(rng.choices(alphabet, k=value_len)))
+            for key in keys))
+    return pii, lines
+
+
+def measure(func: Callable[[str], object], lines: List[str]) -> Dict:
+    """
+    Time func over every line and measure its allocations.
+
+    Args:
+        func (Callable[[str], object]): Code under test, given one line.
+        lines (List[str]): Input lines.
+
+    Returns:
+        Dict: ops_per_sec, p50_ns, p99_ns and alloc_peak_bytes.
+    """
+    for line in lines[:100]:
+        func(line)
+    timings = []
+    clock = time.perf_counter_ns
+    for line in lines:
+        start = clock()
+        func(line)
+        timings.append(clock() - start)
+    timings.sort()
+
+    tracemalloc.start()
+    for line in lines:
+        func(line)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total = sum(timings) or 1
+    return {
+        "ops_per_sec": round(len(lines) * 1e9 / total, 1),
+        "p50_ns": timings[len(timings) // 2],
+        "p99_ns": timings[min(len(timings) - 1, len(timings) * 99 // 100)],
+        "alloc_peak_bytes": peak,
+    }
+
+
+def run(count: int, seed: int) -> Iterator[Dict]:
+    """
+    Run every benchmark on every synthetic case.
+
+    Args:
+        count (int): Number of lines per case.
+        seed (int): Seed of the random generator.
+
+    Yields:
+        Dict: One result per (benchmark, case).
+    """
+    logger = get_logger()
+    devnull = open(os.devnull, 'w')
+    for handler in logger.handlers:
+        handler.setStream(devnull)
+    try:
+        for n_fields, value_len, density in CASES:
+            fields, lines = make_lines(count, n_fields, value_len, density,
+                                       seed)
+            field_set = frozenset(fields)
+            formatter = RedactingFormatter(fields)
+            json_formatter = RedactingFormatter(fields, json_mode=True)
+            # The synthetic keys aren't PII_FIELDS: redact them in the
+            # get_logger case too, so that it measures the same work
+            for handler in logger.handlers:
+                handler.setFormatter(formatter)
+            records = {line: logging.LogRecord("user_data", logging.INFO,
+                                               None, None, line, None, None)
+                       for line in lines}
+            payloads = {line: dict(pair.split("=", 1)
+                                   for pair in line.split(";") if pair)
+                        for line in lines}
+            json_records = {line: logging.LogRecord(
+                "user_data", logging.INFO, None, None,
+                json.dumps(payloads[line]), None, None) for line in lines}
+            benchmarks = {
+                "filter_datum": lambda line: filter_datum(
+                    fields, RedactingFormatter.REDACTION, line,
+                    RedactingFormatter.SEPARATOR),
+                "RedactingFormatter.format": lambda line: formatter.format(
+                    records[line]),
+                "get_logger": logger.info,
+                "redact_json": lambda line: redact_json(
+                    payloads[line], field_set, RedactingFormatter.REDACTION),
+                "RedactingFormatter.format[json]": lambda line:
+                    json_formatter.format(json_records[line]),
+            }
+            for name, func in benchmarks.items():
+                result = {"benchmark": name, "fields": n_fields,
+                          "value_len": value_len, "density": density,
+                          "line_len": sum(map(len, lines)) // len(lines)}
+                result.update(measure(func, lines))
+                yield result
+    finally:
+        devnull.close()
+
+
+def compare(results: List[Dict], baseline_path: str,
+            tolerance: float) -> int:
+    """
+    Report the cases slower than a previous run.
+
+    Args:
+        results (List[Dict]): Results of this run.
+        baseline_path (str): JSON lines written by a previous run.
+        tolerance (float): Accepted slowdown, 0.1 for 10%.
+
+    Returns:
+        int: Number of regressions.
+    """
+    def key(result):
+        return (result["benchmark"], result["fields"], result["value_len"],
+                result["density"])
+
+    with open(baseline_path) as f:
+        baseline = {key(r): r for r in map(json.loads, f) if r}
+    regressions = 0
+    for result in results:
+        before = baseline.get(key(result))
+        if before is None:
+            continue
+        ratio = result["ops_per_sec"] / before["ops_per_sec"]
+        if ratio < 1 - tolerance:
+            regressions += 1
+            sys.stderr.write("regression {}: {:.0f}% of baseline\n".format(
+                key(result), ratio * 100))
+    return regressions
+
+
+def main() -> None:
+    """
+    Parse the command line and run the benchmarks.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--lines', type=int, default=2000,
+                        help="number of lines per case")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help="JSON lines of a previous run")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="accepted slowdown against the baseline")
+    args = parser.parse_args()
+
+    results = []
+    for result in run(args.lines, args.seed):
+        print(json.dumps(result), flush=True)
+        results.append(result)
+    if args.compare and compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,20 +3,32 @@
 Module for encrypting passwords.
 """
 
+import os
+import sys
+import time
+from concurrent.futures import Executor
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Iterable, List, Optional, Tuple
+
 import bcrypt
 
+# Work factor of new hashes, bcrypt's default until calibrated
+ROUNDS = int(os.getenv('BCRYPT_ROUNDS') or 12)
+
 
-def hash_password(password: str) -> bytes:
+def hash_password(password: str, rounds: int = None) -> bytes:
     """
     Hashes a password using bcrypt.
 
     Args:
         password (str): The password to hash.
+        rounds (int): Work factor, ROUNDS by default.
 
     Returns:
         bytes: The hashed password.
     """
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds or ROUNDS)
     hashed_password = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed_password
 
@@ -34,3 +46,158 @@ def is_valid(hashed_password: bytes, password: str) -> bool:
         the hashed password, False otherwise.
     """
     return bcrypt.checkpw(password.encode('utf-8'), hashed_password)
+
+
+def calibrate_rounds(target_ms: float = 250.0, min_rounds: int = 4,
+                     max_rounds: int = 16) -> int:
+    """
+    Pick the highest work factor hashing within a latency budget here.
+
+    Each extra round doubles the hashing time, so rounds are timed
+    from min_rounds upwards until the next one would exceed the budget.
+
+    Args:
+        target_ms (float): Latency budget of one hash, in milliseconds.
+        min_rounds (int): Lowest acceptable work factor.
+        max_rounds (int): Highest work factor to consider.
+
+    Returns:
+        int: Work factor to assign to ROUNDS.
+    """
+    rounds = min_rounds
+    while rounds < max_rounds:
+        start = time.perf_counter()
+        bcrypt.hashpw(b"calibration", bcrypt.gensalt(rounds))
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if elapsed_ms * 2 > target_ms:
+            break
+        rounds += 1
+    return rounds
+
+
+def hash_rounds(hashed_password: bytes) -> int:
+    """
+    Read the work factor a password was hashed with.
+
+    Args:
+        hashed_password (bytes): The hashed password, e.g. b"$2b$12$...".
+
+    Returns:
+        int: The work factor.
+    """
+    return int(hashed_password.split(b'$')[2])
+
+
+def needs_rehash(hashed_password: bytes, rounds: int = None) -> bool:
+    """
+    Checks if a hashed password uses a stale work factor.
+
+    Args:
+        hashed_password (bytes): The hashed password.
+        rounds (int): Expected work factor, ROUNDS by default.
+
+    Returns:
+        bool: True if the password should be hashed again.
+    """
+    return hash_rounds(hashed_password) != (rounds or ROUNDS)
+
+
+def verify_and_rehash(hashed_password: bytes, password: str,
+                      rounds: int = None) -> Tuple[bool, Optional[bytes]]:
+    """
+    Checks a password and upgrades its hash when the cost is stale.
+
+    Args:
+        hashed_password (bytes): The stored hashed password.
+        password (str): The password to check.
+        rounds (int): Expected work factor, ROUNDS by default.
+
+    Returns:
+        Tuple[bool, Optional[bytes]]: Whether the password matches and,
+        when it does with a stale work factor, a new hash to store.
+    """
+    if not is_valid(hashed_password, password):
+        return False, None
+    if needs_rehash(hashed_password, rounds):
+        return True, hash_password(password, rounds)
+    return True, None
+
+
+def _executor(workers: int = None, processes: bool = False) -> Executor:
+    """
+    Create the pool running bcrypt in parallel.
+
+    Args:
+        workers (int): Number of workers, one per core by default.
+        processes (bool): Use processes instead of threads. bcrypt
+            releases the GIL so threads are usually enough.
+
+    Returns:
+        Executor: Thread or process pool.
+    """
+    workers = workers or os.cpu_count() or 1
+    if processes:
+        return ProcessPoolExecutor(max_workers=workers)
+    return ThreadPoolExecutor(max_workers=workers)
+
+
+def hash_many(passwords: Iterable[str], workers: int = None,
+              processes: bool = False, rounds: int = None) -> List[bytes]:
+    """
+    Hashes many passwords in parallel.
+
+    Args:
+        passwords (Iterable[str]): The passwords to hash.
+        workers (int): Number of workers, one per core by default.
+        processes (bool): Use a process pool instead of a thread pool.
+        rounds (int): Work factor, ROUNDS of this process by default:
+            worker processes don't see a ROUNDS set by calibrate_rounds.
+
+    Returns:
+        List[bytes]: The hashed passwords, in the order of passwords.
+    """
+    hash_one = partial(hash_password, rounds=rounds or ROUNDS)
+    with _executor(workers, processes) as executor:
+        return list(executor.map(hash_one, passwords))
+
+
+def verify_many(hashed_passwords: Iterable[bytes], passwords: Iterable[str],
+                workers: int = None, processes: bool = False) -> List[bool]:
+    """
+    Checks many passwords against their hashed versions in parallel.
+
+    Args:
+        hashed_passwords (Iterable[bytes]): The hashed passwords.
+        passwords (Iterable[str]): The passwords to check, in the same order.
+        workers (int): Number of workers, one per core by default.
+        processes (bool): Use a process pool instead of a thread pool.
+
+    Returns:
+        List[bool]: Whether each password matches, in the same order.
+    """
+    with _executor(workers, processes) as executor:
+        return list(executor.map(is_valid, hashed_passwords, passwords))
+
+
+def main() -> None:
+    """
+    Benchmark hash_many with an increasing number of workers.
+
+    Usage: ./encrypt_password.py [number of passwords]
+    """
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    passwords = ["password{}".format(i) for i in range(count)]
+    workers = 1
+    baseline = None
+    while workers <= (os.cpu_count() or 1):
+        start = time.perf_counter()
+        hash_many(passwords, workers)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print("{:>3} workers: {:8.1f} hashes/sec  x{:.2f}".format(
+            workers, count / elapsed, baseline / elapsed))
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main()
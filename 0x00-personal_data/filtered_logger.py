@@ -3,14 +3,52 @@
 Module for filtered logger.
 """
 
+import csv
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
 import mysql.connector
-from typing import List
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import (Any, Callable, Container, Iterator, List, Pattern,
+                    TextIO, Tuple)
 import re
 
 # Define the PII fields
 PII_FIELDS = ('name', 'email', 'phone', 'ssn', 'password')
+# Number of rows fetched from the server per round trip when exporting
+BATCH_SIZE = 1000
+# Maximum number of records waiting for the asynchronous logging thread
+QUEUE_SIZE = 10000
+# What to do with a record when that queue is full
+OVERFLOW_POLICIES = ('block', 'drop', 'count')
+
+
+@lru_cache(maxsize=128)
+def _redaction_engine(fields: Tuple[str, ...], redaction: str,
+                      separator: str) -> Tuple[Pattern, str]:
+    """
+    Compile a single matcher for all the fields of a log line.
+
+    Args:
+        fields (Tuple[str, ...]): Fields to obfuscate.
+        redaction (str): String representing the redaction for the field.
+        separator (str): Character separating all fields in the log line.
+
+    Returns:
+        Tuple[Pattern, str]: Compiled pattern and its replacement template.
+    """
+    names = '|'.join(re.escape(field) for field in dict.fromkeys(fields))
+    pattern = re.compile('({})=.*?{}'.format(names, re.escape(separator)))
+    template = '\\g<1>=' + (redaction + separator).replace('\\', '\\\\')
+    return pattern, template
 
 
 def filter_datum(fields: List[str], redaction: str,
@@ -27,10 +65,64 @@ def filter_datum(fields: List[str], redaction: str,
     Returns:
         str: Log message with specified fields obfuscated.
     """
-    for field in fields:
-        message = re.sub(field+'=.*?'+separator,
-                         field+'='+redaction+separator, message)
-    return message
+    if not fields:
+        return message
+    pattern, template = _redaction_engine(tuple(fields), redaction, separator)
+    return pattern.sub(template, message)
+
+
+def pii_indices(fields: List[str], columns: List[str]) -> Tuple[int, ...]:
+    """
+    Map the fields to obfuscate to their position in a row.
+
+    Args:
+        fields (List[str]): List of fields to obfuscate.
+        columns (List[str]): Column names of the rows, in order.
+
+    Returns:
+        Tuple[int, ...]: Indices of the columns to obfuscate.
+    """
+    wanted = set(fields)
+    return tuple(i for i, column in enumerate(columns) if column in wanted)
+
+
+def redact_row(row: tuple, indices: Tuple[int, ...], redaction: str) -> list:
+    """
+    Replace the values of a row at the given indices with redaction.
+
+    Args:
+        row (tuple): Row as returned by a DB-API cursor.
+        indices (Tuple[int, ...]): Indices from pii_indices.
+        redaction (str): String representing the redaction for the field.
+
+    Returns:
+        list: Copy of the row with the values obfuscated.
+    """
+    values = list(row)
+    for i in indices:
+        values[i] = redaction
+    return values
+
+
+def redact_json(payload: Any, fields: Container[str], redaction: str) -> Any:
+    """
+    Replace the values of the given keys at any depth of a JSON payload.
+
+    Args:
+        payload (Any): Decoded JSON document (dicts, lists and scalars).
+        fields (Container[str]): Keys to obfuscate, ideally a set.
+        redaction (str): String representing the redaction for the field.
+
+    Returns:
+        Any: Redacted copy of the payload.
+    """
+    if isinstance(payload, dict):
+        return {key: redaction if key in fields
+                else redact_json(value, fields, redaction)
+                for key, value in payload.items()}
+    if isinstance(payload, list):
+        return [redact_json(value, fields, redaction) for value in payload]
+    return payload
 
 
 class RedactingFormatter(logging.Formatter):
@@ -40,30 +132,204 @@ class RedactingFormatter(logging.Formatter):
     FORMAT = "[HOLBERTON] %(name)s %(levelname)s %(asctime)-15s: %(message)s"
     SEPARATOR = ";"
 
-    def __init__(self, fields: List[str]):
+    def __init__(self, fields: List[str], json_mode: bool = False):
+        """
+        Args:
+            fields (List[str]): List of fields to obfuscate.
+            json_mode (bool): Also parse messages that are JSON documents
+                and redact their keys at any depth.
+        """
         super(RedactingFormatter, self).__init__(self.FORMAT)
         self.fields = fields
+        self.json_mode = json_mode
+        self._field_set = frozenset(fields)
+
+    def _json_payload(self, record: logging.LogRecord) -> Any:
+        """
+        Return the structured payload of a record, if it has one.
+
+        Args:
+            record (logging.LogRecord): LogRecord instance.
+
+        Returns:
+            Any: A dict or list logged as is, a parsed JSON message in
+            json_mode, or None.
+        """
+        if isinstance(record.msg, (dict, list)) and not record.args:
+            return record.msg
+        if self.json_mode:
+            message = record.getMessage()
+            if message[:1] in ('{', '['):
+                try:
+                    return json.loads(message)
+                except ValueError:
+                    return None
+        return None
 
     def format(self, record: logging.LogRecord) -> str:
         """
         Redact the message of LogRecord instance.
 
+        Records logged with extra={"redacted": True} were already redacted
+        at the row level (see redact_row) and are not scanned again.
+        Dict and list messages, and JSON messages in json_mode, are
+        redacted by key with redact_json instead of the regex.
+
         Args:
             record (logging.LogRecord): LogRecord instance containing message.
 
         Returns:
             str: Formatted and redacted log message.
         """
+        if not getattr(record, 'redacted', False):
+            payload = self._json_payload(record)
+            if payload is not None:
+                record = logging.makeLogRecord(record.__dict__)
+                record.msg = json.dumps(redact_json(
+                    payload, self._field_set, self.REDACTION))
+                record.args = None
+                record.redacted = True
         message = super(RedactingFormatter, self).format(record)
+        if getattr(record, 'redacted', False):
+            return message
         redacted = filter_datum(self.fields, self.REDACTION,
                                 message, self.SEPARATOR)
         return redacted
 
 
-def get_logger() -> logging.Logger:
+class AsyncRedactingHandler(logging.handlers.QueueHandler):
+    """
+    Handler enqueuing records for a background thread that redacts,
+    formats and writes them to a stream in batches.
+    """
+
+    _STOP = None
+
+    def __init__(self, formatter: logging.Formatter, stream: TextIO = None,
+                 queue_size: int = QUEUE_SIZE, overflow: str = 'block',
+                 batch_size: int = 100):
+        """
+        Start the background writer thread.
+
+        Args:
+            formatter (logging.Formatter): Formatter run on the writer thread.
+            stream (TextIO): Output stream, sys.stderr by default.
+            queue_size (int): Maximum number of pending records.
+            overflow (str): 'block' waits for room when the queue is full,
+                'drop' discards the record and 'count' discards it and
+                increments the dropped counter.
+            batch_size (int): Maximum number of records per write.
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("overflow must be one of {}".format(
+                ", ".join(OVERFLOW_POLICIES)))
+        super(AsyncRedactingHandler, self).__init__(queue.Queue(queue_size))
+        self.writer_formatter = formatter
+        self.stream = stream if stream is not None else sys.stderr
+        self.overflow = overflow
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run,
+                                        name="user_data-writer", daemon=True)
+        self._thread.start()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Keep dict and list messages structured for RedactingFormatter.
+
+        Args:
+            record (logging.LogRecord): Record being logged.
+
+        Returns:
+            logging.LogRecord: Record to enqueue.
+        """
+        if isinstance(record.msg, (dict, list)) and not record.args:
+            return logging.makeLogRecord(record.__dict__)
+        return super(AsyncRedactingHandler, self).prepare(record)
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """
+        Put a record on the queue according to the overflow policy.
+
+        Args:
+            record (logging.LogRecord): Prepared record.
+        """
+        if self._closed:
+            return
+        if self.overflow == 'block':
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if self.overflow == 'count':
+                self.dropped += 1
+
+    def _run(self) -> None:
+        """
+        Drain the queue, writing each batch with a single flush.
+        """
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines = []
+            stop = False
+            for record in batch:
+                if record is self._STOP:
+                    stop = True
+                    continue
+                try:
+                    lines.append(self.writer_formatter.format(record))
+                except Exception:
+                    self.handleError(record)
+            if lines:
+                try:
+                    self.stream.write("\n".join(lines) + "\n")
+                    self.stream.flush()
+                except Exception:
+                    self.handleError(batch[0])
+            for _ in batch:
+                self.queue.task_done()
+            if stop:
+                return
+
+    def flush(self) -> None:
+        """
+        Wait until every queued record has been written.
+        """
+        if self._thread.is_alive():
+            self.queue.join()
+
+    def close(self) -> None:
+        """
+        Write the remaining records and stop the background thread.
+
+        logging.shutdown() calls this at exit so that nothing is lost.
+        """
+        if not self._closed:
+            self._closed = True
+            self.queue.put(self._STOP)
+            self._thread.join()
+        super(AsyncRedactingHandler, self).close()
+
+
+def get_logger(asynchronous: bool = False, queue_size: int = QUEUE_SIZE,
+               overflow: str = 'block') -> logging.Logger:
     """
     Create and configure a logger named "user_data".
 
+    Args:
+        asynchronous (bool): Redact, format and write records on a
+            background thread instead of the calling one.
+        queue_size (int): Maximum number of pending asynchronous records.
+        overflow (str): Policy when that queue is full, one of
+            OVERFLOW_POLICIES.
+
     Returns:
         logging.Logger: Configured logger object.
     """
@@ -71,19 +337,23 @@ def get_logger() -> logging.Logger:
     logger.setLevel(logging.INFO)
     logger.propagate = False
 
-    # Create StreamHandler with RedactingFormatter
-    stream_handler = logging.StreamHandler()
     formatter = RedactingFormatter(PII_FIELDS)
-    stream_handler.setFormatter(formatter)
+    if asynchronous:
+        handler = AsyncRedactingHandler(formatter, queue_size=queue_size,
+                                        overflow=overflow)
+    else:
+        # Create StreamHandler with RedactingFormatter
+        handler = logging.StreamHandler()
+        handler.setFormatter(formatter)
 
-    logger.addHandler(stream_handler)
+    logger.addHandler(handler)
 
     return logger
 
 
-def get_db() -> mysql.connector.connection.MySQLConnection:
+def connect_db() -> mysql.connector.connection.MySQLConnection:
     """
-    Create a connection to the database.
+    Open a new connection to the database.
 
     Returns:
         mysql.connector.connection.MySQLConnection: Database connection object.
@@ -99,21 +369,376 @@ def get_db() -> mysql.connector.connection.MySQLConnection:
     return connection
 
 
+class PooledConnection:
+    """
+    Proxy to a pooled connection, closing it gives it back to the pool.
+
+    Like MySQLConnection, it can be used in a with block that closes it,
+    and a proxy garbage collected without being closed gives its
+    connection back as well.
+    """
+
+    def __init__(self, pool: 'ConnectionPool', connection: Any):
+        """
+        Wrap a connection lent by pool.
+        """
+        self._pool = pool
+        self._connection = connection
+
+    def __getattr__(self, name: str) -> Any:
+        """
+        Delegate everything else to the wrapped connection.
+        """
+        if self._connection is None:
+            raise AttributeError("connection was given back to the pool")
+        return getattr(self._connection, name)
+
+    def __enter__(self) -> 'PooledConnection':
+        """
+        Use the connection in a with block.
+        """
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        """
+        Give the connection back to the pool at the end of the with block.
+        """
+        self.close()
+
+    def __del__(self) -> None:
+        """
+        Give back the connection of a proxy that was never closed.
+        """
+        if getattr(self, '_connection', None) is not None:
+            self.close()
+
+    def close(self) -> None:
+        """
+        Give the connection back to the pool, only the first call counts.
+        """
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            self._pool.release(connection)
+
+
+class ConnectionPool:
+    """
+    Pool of reusable database connections.
+    """
+
+    def __init__(self, connect: Callable[[], Any], size: int = 5,
+                 idle_timeout: float = 300.0, ping: bool = True):
+        """
+        Initialize an empty pool.
+
+        Args:
+            connect (Callable[[], Any]): Opens a new DB-API connection.
+            size (int): Maximum number of connections lent at once.
+            idle_timeout (float): Seconds after which an idle connection
+                is closed instead of reused, 0 keeps them forever.
+            ping (bool): Check that a connection is alive before lending it.
+        """
+        self.connect = connect
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.ping = ping
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def borrow(self, timeout: float = None) -> PooledConnection:
+        """
+        Lend a healthy connection, reusing an idle one when possible.
+
+        Args:
+            timeout (float): Seconds to wait for a free slot, None waits
+                forever.
+
+        Returns:
+            PooledConnection: Connection to close once done with it.
+        """
+        if not self._slots.acquire(timeout=timeout):
+            raise RuntimeError("connection pool exhausted")
+        try:
+            connection = self._reuse()
+            if connection is None:
+                connection = self.connect()
+        except Exception:
+            self._slots.release()
+            raise
+        return PooledConnection(self, connection)
+
+    def _reuse(self) -> Any:
+        """
+        Pop the most recently used idle connection still worth lending.
+
+        Returns:
+            Any: Connection or None when no idle one is usable.
+        """
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                connection, last_used = self._idle.pop()
+            expired = (self.idle_timeout and
+                       time.monotonic() - last_used > self.idle_timeout)
+            if not expired and (not self.ping or self._alive(connection)):
+                return connection
+            self._discard(connection)
+
+    @staticmethod
+    def _alive(connection: Any) -> bool:
+        """
+        Health check of a connection before lending it.
+
+        Args:
+            connection (Any): Idle connection.
+
+        Returns:
+            bool: False when the connection reports being disconnected.
+        """
+        is_connected = getattr(connection, 'is_connected', None)
+        if is_connected is None:
+            return True
+        try:
+            return bool(is_connected())
+        except Exception:
+            return False
+
+    @staticmethod
+    def _discard(connection: Any) -> None:
+        """
+        Close a connection leaving the pool, ignoring errors.
+
+        Args:
+            connection (Any): Connection to close.
+        """
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def release(self, connection: Any) -> None:
+        """
+        Take back a lent connection, rolling back what it left uncommitted
+        so that the next borrower starts from a clean session.
+
+        Args:
+            connection (Any): Connection returned by a PooledConnection.
+        """
+        try:
+            if getattr(connection, 'in_transaction', True):
+                connection.rollback()
+        except Exception:
+            # Unread results or a broken link: don't lend it again
+            self._discard(connection)
+        else:
+            with self._lock:
+                self._idle.append((connection, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self, timeout: float = None) -> Iterator[PooledConnection]:
+        """
+        Borrow a connection for the duration of a with block.
+
+        Args:
+            timeout (float): Seconds to wait for a free slot.
+
+        Yields:
+            PooledConnection: Connection given back when the block exits.
+        """
+        connection = self.borrow(timeout)
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def close(self) -> None:
+        """
+        Close every idle connection.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+        for connection, _ in idle:
+            self._discard(connection)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """
+    Return the process-wide pool of database connections.
+
+    PERSONAL_DATA_DB_POOL_SIZE, PERSONAL_DATA_DB_POOL_IDLE_TIMEOUT (seconds)
+    and PERSONAL_DATA_DB_POOL_PING ("0" disables the health check) tune it,
+    PERSONAL_DATA_DB_POOL_TIMEOUT (seconds) limits the wait of get_db.
+
+    Returns:
+        ConnectionPool: Pool opening connections with connect_db.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(
+                connect_db,
+                size=int(os.getenv('PERSONAL_DATA_DB_POOL_SIZE') or 5),
+                idle_timeout=float(
+                    os.getenv('PERSONAL_DATA_DB_POOL_IDLE_TIMEOUT') or 300),
+                ping=os.getenv('PERSONAL_DATA_DB_POOL_PING', "1") != "0")
+        return _pool
+
+
+def get_db() -> mysql.connector.connection.MySQLConnection:
+    """
+    Get a connection to the database from the pool.
+
+    Waits at most PERSONAL_DATA_DB_POOL_TIMEOUT seconds (30 by default)
+    for a connection when all of them are lent.
+
+    Returns:
+        mysql.connector.connection.MySQLConnection: Database connection object,
+        closing it gives it back to the pool.
+
+    Raises:
+        RuntimeError: No connection was given back in time.
+    """
+    timeout = float(os.getenv('PERSONAL_DATA_DB_POOL_TIMEOUT') or 30)
+    return get_pool().borrow(timeout=timeout)
+
+
+def get_sqlite_db(csv_path: str) -> sqlite3.Connection:
+    """
+    Create an in-memory stand-in database loaded from a CSV dump.
+
+    Args:
+        csv_path (str): Path to a CSV file shaped like user_data.csv.
+
+    Returns:
+        sqlite3.Connection: Connection holding a "users" table.
+    """
+    connection = sqlite3.connect(":memory:")
+    with open(csv_path, newline='') as f:
+        reader = csv.reader(f)
+        columns = next(reader)
+        connection.execute("CREATE TABLE users ({});".format(
+            ", ".join('"{}" TEXT'.format(c) for c in columns)))
+        connection.executemany("INSERT INTO users VALUES ({});".format(
+            ", ".join("?" for _ in columns)), reader)
+    connection.commit()
+    return connection
+
+
+def column_names(cursor) -> Tuple[str, ...]:
+    """
+    Return the column names of the last query run on a cursor.
+
+    Args:
+        cursor: DB-API cursor (mysql.connector or sqlite3).
+
+    Returns:
+        Tuple[str, ...]: Column names in row order.
+    """
+    names = getattr(cursor, 'column_names', None)
+    if names is None:
+        names = tuple(column[0] for column in cursor.description)
+    return names
+
+
+def iter_rows(cursor, batch_size: int = BATCH_SIZE) -> Iterator[tuple]:
+    """
+    Stream the rows of a cursor in batches of fetchmany.
+
+    Args:
+        cursor: DB-API cursor with an executed query.
+        batch_size (int): Number of rows fetched per round trip.
+
+    Yields:
+        tuple: One row at a time, holding at most one batch in memory.
+    """
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def export_users(db, logger: logging.Logger, batch_size: int = BATCH_SIZE,
+                 progress_every: int = 0) -> int:
+    """
+    Log every row of the "users" table under a filtered format.
+
+    Args:
+        db: DB-API connection (mysql.connector or a stand-in).
+        logger (logging.Logger): Logger receiving one record per row.
+        batch_size (int): Number of rows fetched per round trip.
+        progress_every (int): Report rows/sec every N rows, 0 disables it.
+
+    Returns:
+        int: Number of exported rows.
+    """
+    try:
+        # Unbuffered cursor: rows stay on the server until fetched
+        cursor = db.cursor(buffered=False)
+    except TypeError:
+        cursor = db.cursor()
+    count = 0
+    start = time.perf_counter()
+    try:
+        cursor.execute("SELECT * FROM users;")
+        fields = column_names(cursor)
+        indices = pii_indices(PII_FIELDS, fields)
+        template = "; ".join("{}={{}}".format(f.replace("{", "{{")
+                                              .replace("}", "}}"))
+                             for f in fields) + ";"
+        for row in iter_rows(cursor, batch_size):
+            values = redact_row(row, indices, RedactingFormatter.REDACTION)
+            logger.info(template.format(*values), extra={'redacted': True})
+            count += 1
+            if progress_every and count % progress_every == 0:
+                _report_progress(count, start)
+    finally:
+        cursor.close()
+    if progress_every:
+        _report_progress(count, start)
+    return count
+
+
+def _report_progress(count: int, start: float) -> None:
+    """
+    Write the export progress and throughput to stderr.
+
+    Args:
+        count (int): Number of rows exported so far.
+        start (float): perf_counter value when the export started.
+    """
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed > 0 else 0.0
+    sys.stderr.write(
+        "exported {} rows ({:.0f} rows/sec)\n".format(count, rate))
+
+
 def main() -> None:
     """
     Retrieve all rows from the "users" table in the database
     and log each row under a filtered format.
+
+    PERSONAL_DATA_DB_CSV swaps the MySQL server for an SQLite stand-in
+    loaded from a CSV dump, PERSONAL_DATA_BATCH_SIZE sets the fetch batch
+    size and PERSONAL_DATA_PROGRESS the rows/sec report interval.
     """
     logger = get_logger()
-    db = get_db()
-    cursor = db.cursor()
-    cursor.execute("SELECT * FROM users;")
-    fields = cursor.column_names
-    for row in cursor:
-        message = "".join("{}={}; ".format(i, j) for i, j in zip(fields, row))
-        logger.info(message.strip())
-    cursor.close()
-    db.close()
+    csv_path = os.getenv('PERSONAL_DATA_DB_CSV')
+    db = get_sqlite_db(csv_path) if csv_path else get_db()
+    batch_size = int(os.getenv('PERSONAL_DATA_BATCH_SIZE') or BATCH_SIZE)
+    progress_every = int(os.getenv('PERSONAL_DATA_PROGRESS') or 0)
+    try:
+        export_users(db, logger, batch_size, progress_every)
+    finally:
+        db.close()
 
 
 if __name__ == "__main__":
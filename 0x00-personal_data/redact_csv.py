@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Command line tool redacting the PII columns of large CSV user dumps.
+
+The input is memory-mapped and split into shards on line boundaries
+that are not inside a quoted field, each shard is redacted by a process
+of a pool and the shards are written back in their original order.
+
+Usage: ./redact_csv.py user_data.csv redacted.csv --workers 8
+"""
+
+import argparse
+import csv
+import io
+import mmap
+import os
+import sys
+import time
+from multiprocessing import Pool
+from typing import Iterator, List, Tuple
+
+from filtered_logger import PII_FIELDS, RedactingFormatter
+from filtered_logger import pii_indices, redact_row
+
+# Default size of a shard handed to a worker, in bytes
+SHARD_SIZE = 64 * 1024 * 1024
+# Size of the windows copied out of the mapping when counting quotes
+WINDOW_SIZE = 1024 * 1024
+
+
+def count_quotes(data: mmap.mmap, start: int, end: int) -> int:
+    """
+    Count the quote characters of data[start:end].
+
+    Args:
+        data (mmap.mmap): Mapped input file.
+        start (int): Start offset.
+        end (int): End offset, excluded.
+
+    Returns:
+        int: Number of quote characters.
+    """
+    count = 0
+    for offset in range(start, end, WINDOW_SIZE):
+        count += data[offset:min(offset + WINDOW_SIZE, end)].count(b'"')
+    return count
+
+
+def next_boundary(data: mmap.mmap, offset: int, quotes: int) -> int:
+    """
+    Find the first line boundary at or after offset outside quotes.
+
+    Args:
+        data (mmap.mmap): Mapped input file.
+        offset (int): Position to start looking from.
+        quotes (int): Number of quote characters in data[0:offset].
+
+    Returns:
+        int: Position right after the newline ending a CSV record,
+        or the size of the file.
+    """
+    size = len(data)
+    while offset < size:
+        newline = data.find(b'\n', offset)
+        if newline == -1:
+            return size
+        quotes += count_quotes(data, offset, newline)
+        offset = newline + 1
+        # Escaped quotes come in pairs, an even count means we are outside
+        if quotes % 2 == 0:
+            return offset
+    return size
+
+
+def shard_bounds(data: mmap.mmap, start: int,
+                 shard_size: int) -> Iterator[Tuple[int, int]]:
+    """
+    Split data[start:] into shards ending on CSV record boundaries.
+
+    Args:
+        data (mmap.mmap): Mapped input file.
+        start (int): Offset of the first record.
+        shard_size (int): Approximate size of a shard in bytes.
+
+    Yields:
+        Tuple[int, int]: Start and end offsets of each shard.
+    """
+    size = len(data)
+    quotes = count_quotes(data, 0, start)
+    while start < size:
+        target = min(start + shard_size, size)
+        quotes += count_quotes(data, start, target)
+        end = next_boundary(data, target, quotes)
+        quotes += count_quotes(data, target, end)
+        yield start, end
+        start = end
+
+
+def redact_shard(args: Tuple[str, int, int, Tuple[int, ...], str]) -> bytes:
+    """
+    Redact the records of one shard of the input file.
+
+    Args:
+        args (tuple): Input path, start and end offsets, indices of the
+            columns to obfuscate and the redaction string.
+
+    Returns:
+        bytes: Redacted CSV records of the shard.
+    """
+    path, start, end, indices, redaction = args
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            text = data[start:end].decode('utf-8')
+    output = io.StringIO()
+    writer = csv.writer(output, quoting=csv.QUOTE_ALL, lineterminator='\n')
+    for row in csv.reader(io.StringIO(text, newline='')):
+        writer.writerow(redact_row(row, indices, redaction))
+    return output.getvalue().encode('utf-8')
+
+
+def redact_csv(path: str, out, fields: List[str] = PII_FIELDS,
+               workers: int = None, shard_size: int = SHARD_SIZE) -> dict:
+    """
+    Redact the given columns of a CSV file with a process pool.
+
+    Args:
+        path (str): Path of the input CSV file, with a header line.
+        out: Binary stream receiving the redacted CSV.
+        fields (List[str]): Columns to obfuscate.
+        workers (int): Number of processes, os.cpu_count() by default.
+        shard_size (int): Approximate size of a shard in bytes.
+
+    Returns:
+        dict: Number of bytes read, number of shards and elapsed seconds.
+    """
+    start_time = time.perf_counter()
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return {"bytes": 0, "shards": 0, "seconds": 0.0}
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            header_end = next_boundary(data, 0, 0)
+            header = data[:header_end]
+            bounds = list(shard_bounds(data, header_end, shard_size))
+            size = len(data)
+    columns = next(csv.reader(io.StringIO(header.decode('utf-8'),
+                                          newline='')))
+    indices = pii_indices(fields, columns)
+    out.write(header)
+    tasks = [(path, s, e, indices, RedactingFormatter.REDACTION)
+             for s, e in bounds]
+    with Pool(workers) as pool:
+        for chunk in pool.imap(redact_shard, tasks):
+            out.write(chunk)
+    return {"bytes": size, "shards": len(tasks),
+            "seconds": time.perf_counter() - start_time}
+
+
+def main() -> None:
+    """
+    Parse the command line, redact the file and report the throughput.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('input', help="CSV file with a header line")
+    parser.add_argument('output', nargs='?', default='-',
+                        help="redacted CSV file, stdout by default")
+    parser.add_argument('--fields', default=",".join(PII_FIELDS),
+                        help="comma separated columns to obfuscate")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="number of processes, one per core by default")
+    parser.add_argument('--shard-size', type=int,
+                        default=SHARD_SIZE // (1024 * 1024),
+                        help="approximate shard size in MiB")
+    args = parser.parse_args()
+
+    fields = [field for field in args.fields.split(",") if field]
+    if args.output == '-':
+        stats = redact_csv(args.input, sys.stdout.buffer, fields,
+                           args.workers, args.shard_size * 1024 * 1024)
+    else:
+        with open(args.output, 'wb') as out:
+            stats = redact_csv(args.input, out, fields,
+                               args.workers, args.shard_size * 1024 * 1024)
+    seconds = stats["seconds"] or 1e-9
+    sys.stderr.write("redacted {} bytes in {} shards in {:.2f}s "
+                     "({:.1f} MiB/s)\n".format(
+                         stats["bytes"], stats["shards"], stats["seconds"],
+                         stats["bytes"] / seconds / (1024 * 1024)))
+
+
+if __name__ == "__main__":
+    main()
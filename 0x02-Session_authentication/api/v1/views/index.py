@@ -1,10 +1,15 @@
 #!/usr/bin/env python3
 """ Module of Index views
 """
-from flask import jsonify, abort
+from flask import jsonify, abort, request
+import time
 from api.v1.views import app_views
 
 
+# Largest window of active_sessions, in minutes
+MAX_MINUTES = 7 * 24 * 60
+
+
 @app_views.route('/status', methods=['GET'], strict_slashes=False)
 def status() -> str:
     """ GET /api/v1/status
@@ -17,12 +22,40 @@ def status() -> str:
 @app_views.route('/stats/', strict_slashes=False)
 def stats() -> str:
     """ GET /api/v1/stats
+    Query parameter (optional):
+      - minutes: window of active_sessions, 30 by default, at most
+        MAX_MINUTES
     Return:
-      - the number of each objects
+      - the number of each objects and, with the file storage outside
+        of COHERENT mode, of users by email domain, of sessions per user
+        and of sessions created in the last minutes, read from aggregates
+        kept up to date on save and remove
+      - 400 if minutes is wrong
     """
     from models.user import User
+    from models.user_session import UserSession
+    minutes = request.args.get('minutes', '30')
+    if not minutes.isdecimal() or len(minutes) > len(str(MAX_MINUTES)) \
+            or int(minutes) > MAX_MINUTES:
+        return jsonify({'error': "Wrong minutes"}), 400
     stats = {}
     stats['users'] = User.count()
+    stats['sessions'] = UserSession.count()
+    try:
+        by_domain = User.aggregate('email_domain')
+        by_user = UserSession.aggregate('user_id')
+        by_minute = UserSession.aggregate('created_minute')
+    except ValueError:
+        # Aggregates are only kept with the file storage, outside of
+        # COHERENT mode
+        return jsonify(stats)
+    stats['users_by_email_domain'] = dict(by_domain.counts)
+    stats['users_with_sessions'] = by_user.size()
+    stats['sessions_per_user'] = round(
+        by_user.objects() / by_user.size(), 2) if by_user.size() else 0
+    now = int(time.time()) // 60
+    stats['active_sessions'] = by_minute.between(now - int(minutes) + 1,
+                                                 now + 1)
     return jsonify(stats)
 
 
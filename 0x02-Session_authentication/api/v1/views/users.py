@@ -9,10 +9,28 @@ from models.user import User
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters (optional):
+      - limit, offset: window of the list
+      - order_by: attribute to sort by, "-" first for a descending order
     Return:
       - list of all User objects JSON represented
+      - 400 if a query parameter is wrong
     """
-    all_users = [user.to_json() for user in User.all()]
+    limit = request.args.get('limit')
+    offset = request.args.get('offset', '0')
+    order_by = request.args.get('order_by')
+    if limit is not None and not limit.isdigit():
+        return jsonify({'error': "Wrong limit"}), 400
+    if not offset.isdigit():
+        return jsonify({'error': "Wrong offset"}), 400
+    public = ('id', 'created_at', 'updated_at') + tuple(
+        name for name in User.attribute_names() if name[0] != '_')
+    if order_by is not None and order_by.lstrip('-') not in public:
+        return jsonify({'error': "Wrong order_by"}), 400
+    all_users = [user.to_json() for user in User.query(
+        order_by=order_by,
+        limit=int(limit) if limit is not None else None,
+        offset=int(offset))]
     return jsonify(all_users)
 
 
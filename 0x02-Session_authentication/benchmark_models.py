@@ -0,0 +1,500 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the models store.
+
+Usage: ./benchmark_models.py memory [--count N]
+       ./benchmark_models.py load [--count N]
+       ./benchmark_models.py stress [--threads N] [--operations N]
+                                    [--durability always|deferred]
+                                    [--journal]
+       ./benchmark_models.py coherence [--processes N] [--operations N]
+                                       [--durability always|deferred]
+                                       [--journal]
+       ./benchmark_models.py bulk [--counts N [N ...]] [--sample N]
+       ./benchmark_models.py serialize [--count N] [--changed PERCENT]
+       ./benchmark_models.py cache [--count N] [--gets N]
+                                   [--sizes N [N ...]]
+       ./benchmark_models.py bloom [--count N] [--lookups N]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from models.base import STORAGES, TIMESTAMP_FORMAT
+from models.bloom import BLOOM_FILTERS
+from models.engine.sqlite_storage import SQLiteStorage
+from models.user import User
+from models.user_session import UserSession
+
+
+class LegacyUser():
+    """ User as stored before __slots__: a __dict__ and two datetimes
+    """
+
+    def __init__(self, **kwargs):
+        """ Initialize like the former Base and User did
+        """
+        self.id = kwargs.get('id')
+        self.created_at = datetime.strptime(kwargs.get('created_at'),
+                                            TIMESTAMP_FORMAT)
+        self.updated_at = datetime.strptime(kwargs.get('updated_at'),
+                                            TIMESTAMP_FORMAT)
+        self.email = kwargs.get('email')
+        self._password = kwargs.get('_password')
+        self.first_name = kwargs.get('first_name')
+        self.last_name = kwargs.get('last_name')
+
+
+class LegacyUserSession():
+    """ UserSession as stored before __slots__
+    """
+
+    def __init__(self, **kwargs):
+        """ Initialize like the former Base and UserSession did
+        """
+        self.id = kwargs.get('id')
+        self.created_at = datetime.strptime(kwargs.get('created_at'),
+                                            TIMESTAMP_FORMAT)
+        self.updated_at = datetime.strptime(kwargs.get('updated_at'),
+                                            TIMESTAMP_FORMAT)
+        self.user_id = kwargs.get('user_id')
+        self.session_id = kwargs.get('session_id')
+
+
+def make_rows(count: int, sessions: bool) -> str:
+    """ Return count serialized users, or sessions of count / 10 users
+    """
+    now = datetime.utcnow().strftime(TIMESTAMP_FORMAT)
+    user_ids = [str(uuid.uuid4()) for _ in range(max(1, count // 10))]
+    rows = []
+    for i in range(count):
+        row = {'id': str(uuid.uuid4()), 'created_at': now,
+               'updated_at': now}
+        if sessions:
+            row['user_id'] = user_ids[i % len(user_ids)]
+            row['session_id'] = str(uuid.uuid4())
+        else:
+            row['email'] = "user{}@example.com".format(i)
+            row['_password'] = uuid.uuid4().hex * 2
+            row['first_name'] = "First{}".format(i)
+            row['last_name'] = "Last{}".format(i)
+        rows.append(row)
+    return json.dumps(rows)
+
+
+def bytes_per_object(cls, payload: str) -> float:
+    """ Load objects from JSON as load_from_file does and return the
+        memory they keep, per object: the object, its __dict__ and its
+        attribute values, each shared value being counted once
+    """
+    objs = [cls(**row) for row in json.loads(payload)]
+    seen = set()
+    total = 0
+    for obj in objs:
+        parts = [obj]
+        if hasattr(obj, '__dict__'):
+            parts.append(obj.__dict__)
+            parts.extend(obj.__dict__.values())
+        for klass in type(obj).__mro__:
+            for name in klass.__dict__.get('__slots__', ()):
+                if hasattr(obj, name):
+                    parts.append(getattr(obj, name))
+        for part in parts:
+            if id(part) not in seen:
+                seen.add(id(part))
+                total += sys.getsizeof(part)
+    return total / len(objs)
+
+
+def memory(args):
+    """ Report the bytes per object before and after __slots__
+    """
+    for name, legacy, cls, sessions in (
+            ("User", LegacyUser, User, False),
+            ("UserSession", LegacyUserSession, UserSession, True)):
+        payload = make_rows(args.count, sessions)
+        before = bytes_per_object(legacy, payload)
+        after = bytes_per_object(cls, payload)
+        print(json.dumps({"benchmark": "memory", "model": name,
+                          "count": args.count,
+                          "bytes_per_object_before": round(before),
+                          "bytes_per_object_after": round(after)}))
+
+
+def timed(func) -> float:
+    """ Run func and return the elapsed seconds
+    """
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def load(args):
+    """ Time User.load_from_file against the former loading path
+    """
+    os.chdir(tempfile.mkdtemp())
+    with open(".db_User.json", 'w') as f:
+        f.write(json.dumps({row['id']: row
+                            for row in json.loads(make_rows(args.count,
+                                                            False))}))
+
+    def legacy():
+        with open(".db_User.json") as f:
+            {obj_id: LegacyUser(**obj_json)
+             for obj_id, obj_json in json.load(f).items()}
+
+    def load_with(**settings):
+        def run():
+            for name, value in settings.items():
+                setattr(User, name, value)
+            User.load_from_file()
+            for name in settings:
+                delattr(User, name)
+        return run
+
+    results = {"benchmark": "load", "count": args.count,
+               "legacy_seconds": timed(legacy),
+               "load_from_file_seconds": timed(User.load_from_file),
+               "lazy_load_from_file_seconds": timed(
+                   load_with(LAZY_LOAD=True))}
+    User.SNAPSHOT = True
+    User.save_to_file()
+    del User.SNAPSHOT
+    results["snapshot_load_from_file_seconds"] = timed(
+        load_with(SNAPSHOT=True))
+    results["lazy_snapshot_load_from_file_seconds"] = timed(
+        load_with(SNAPSHOT=True, LAZY_LOAD=True))
+    for key, value in results.items():
+        if key.endswith("_seconds"):
+            results[key] = round(value, 3)
+    print(json.dumps(results))
+
+
+def stress(args):
+    """ Save, search and remove users from many threads while the file is
+        read back, then check that nothing was lost or torn
+    """
+    os.chdir(tempfile.mkdtemp())
+    User.DURABILITY = args.durability
+    User.JOURNAL = args.journal
+    User.load_from_file()
+    errors = []
+    kept = []
+    torn = []
+    done = threading.Event()
+    start = threading.Barrier(args.threads + 1)
+
+    def worker(n):
+        mine = []
+        try:
+            start.wait()
+            for i in range(args.operations):
+                step = i % 5
+                if step < 2:
+                    user = User(email="user{}-{}@example.com".format(n, i))
+                    user.save()
+                    mine.append(user)
+                elif step == 2:
+                    user = mine[-1]
+                    assert User.search({'email': user.email}) == [user]
+                elif step == 3:
+                    assert len(User.all()) >= len(mine)
+                    assert User.get(mine[0].id) == mine[0]
+                else:
+                    mine.pop(0).remove()
+        except Exception as e:
+            errors.append(repr(e))
+        kept.append(len(mine))
+
+    def reader():
+        while not done.is_set():
+            try:
+                with open(".db_User.json") as f:
+                    json.load(f)
+            except FileNotFoundError:
+                pass
+            except ValueError:
+                torn.append(1)
+
+    threads = [threading.Thread(target=worker, args=(n,))
+               for n in range(args.threads)]
+    threads.append(threading.Thread(target=reader))
+    for thread in threads:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    for thread in threads[:-1]:
+        thread.join()
+    User.flush()
+    elapsed = time.perf_counter() - began
+    done.set()
+    threads[-1].join()
+    count = User.count()
+    User.load_from_file()
+    results = {"benchmark": "stress", "threads": args.threads,
+               "operations": args.threads * args.operations,
+               "durability": args.durability, "journal": args.journal,
+               "seconds": round(elapsed, 3),
+               "ops_per_second": round(args.threads * args.operations /
+                                       elapsed),
+               "errors": len(errors), "torn_reads": len(torn),
+               "expected": sum(kept), "count": count,
+               "reloaded": User.count()}
+    print(json.dumps(results))
+    for error in errors[:10]:
+        print(error, file=sys.stderr)
+    ok = (not errors and not torn and
+          results["expected"] == count == results["reloaded"])
+    sys.exit(0 if ok else 1)
+
+
+def coherence_worker(n: int, args, start, done, results):
+    """ Save and remove users from one process, then count them all
+    """
+    errors = []
+    mine = []
+    try:
+        User.load_from_file()
+        start.wait()
+        for i in range(args.operations):
+            user = User(email="user{}-{}@example.com".format(n, i))
+            user.save()
+            mine.append(user)
+            if i % 4 == 3:
+                mine.pop(0).remove()
+            if i % 10 == 9:
+                other = "user{}-{}@example.com".format((n + 1) %
+                                                       args.processes, 0)
+                User.search({'email': other})
+        User.flush()
+    except Exception as e:
+        errors.append(repr(e))
+    done.wait()
+    results.put((len(mine), User.count(), errors))
+
+
+def coherence(args):
+    """ Save and remove users from processes sharing the files in
+        COHERENT mode, then check that every process sees all of them
+    """
+    os.chdir(tempfile.mkdtemp())
+    User.COHERENT = True
+    User.DURABILITY = args.durability
+    User.JOURNAL = args.journal
+    context = multiprocessing.get_context('fork')
+    start = context.Barrier(args.processes + 1)
+    done = context.Barrier(args.processes + 1)
+    results = context.Queue()
+    processes = [context.Process(target=coherence_worker,
+                                 args=(n, args, start, done, results))
+                 for n in range(args.processes)]
+    for process in processes:
+        process.start()
+    start.wait()
+    began = time.perf_counter()
+    done.wait()
+    elapsed = time.perf_counter() - began
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    User.load_from_file()
+    expected = sum(kept for kept, _, _ in outcomes)
+    errors = [error for _, _, errs in outcomes for error in errs]
+    counts = sorted(set(count for _, count, _ in outcomes))
+    print(json.dumps({"benchmark": "coherence", "processes": args.processes,
+                      "operations": args.processes * args.operations,
+                      "durability": args.durability, "journal": args.journal,
+                      "seconds": round(elapsed, 3),
+                      "ops_per_second": round(args.processes *
+                                              args.operations / elapsed),
+                      "errors": len(errors), "expected": expected,
+                      "counts": counts, "reloaded": User.count()}))
+    for error in errors[:10]:
+        print(error, file=sys.stderr)
+    ok = not errors and counts == [expected] and User.count() == expected
+    sys.exit(0 if ok else 1)
+
+
+def bulk(args):
+    """ Time save_many and remove_many against save and remove loops,
+        rewriting the file and with the journal
+    """
+    for count in args.counts:
+        for journal in (False, True):
+            User.JOURNAL = journal
+            users = [User(email="user{}@example.com".format(i))
+                     for i in range(count)]
+            sample = users[:min(count, args.sample)]
+
+            os.chdir(tempfile.mkdtemp())
+            User.load_from_file()
+            save_loop = timed(lambda: [user.save() for user in sample])
+            remove_loop = timed(lambda: [user.remove() for user in sample])
+
+            os.chdir(tempfile.mkdtemp())
+            User.load_from_file()
+            save_many = timed(lambda: User.save_many(users))
+            remove_many = timed(lambda: User.remove_many(users))
+            print(json.dumps({
+                "benchmark": "bulk", "count": count, "journal": journal,
+                "loop_count": len(sample),
+                "save_loop_seconds": round(save_loop, 3),
+                "remove_loop_seconds": round(remove_loop, 3),
+                "save_many_seconds": round(save_many, 3),
+                "remove_many_seconds": round(remove_many, 3)}))
+
+
+def serialize(args):
+    """ Time to_json and save_to_file with and without cached JSON
+    """
+    os.chdir(tempfile.mkdtemp())
+    User.JOURNAL = False
+    User.load_from_file()
+    users = [User(email="user{}@example.com".format(i), first_name="First",
+                  last_name="Last{}".format(i)) for i in range(args.count)]
+    User.save_many(users)
+
+    def uncached():
+        for user in users:
+            user._json = None
+            user._json_text = None
+
+    changed = users[:args.count * args.changed // 100]
+    uncached()
+    results = {"benchmark": "serialize", "count": args.count,
+               "to_json_seconds": timed(
+                   lambda: [user.to_json() for user in users]),
+               "cached_to_json_seconds": timed(
+                   lambda: [user.to_json() for user in users])}
+    uncached()
+    results["save_to_file_seconds"] = timed(User.save_to_file)
+    for user in changed:
+        user.first_name = "Changed"
+    results["changed"] = len(changed)
+    results["cached_save_to_file_seconds"] = timed(User.save_to_file)
+    for key, value in results.items():
+        if key.endswith("_seconds"):
+            results[key] = round(value, 3)
+    print(json.dumps(results))
+
+
+def cache(args):
+    """ Time User.get on the sqlite storage for each cache size, 80% of
+        the gets going to 20% of the users
+    """
+    file_path = os.path.join(tempfile.mkdtemp(), "cache.sqlite3")
+    User.STORAGE = 'sqlite'
+    STORAGES['sqlite'] = SQLiteStorage(file_path)
+    ids = []
+    for start in range(0, args.count, 10000):
+        users = [User(email="user{}@example.com".format(i))
+                 for i in range(start, min(args.count, start + 10000))]
+        User.save_many(users)
+        ids.extend(user.id for user in users)
+    hot = ids[:len(ids) // 5]
+    pattern = random.Random(0)
+    gets = [pattern.choice(hot if pattern.random() < 0.8 else ids)
+            for _ in range(args.gets)]
+    for size in args.sizes:
+        User.CACHE_SIZE = size
+        STORAGES['sqlite'] = SQLiteStorage(file_path)
+        seconds = timed(lambda: [User.get(obj_id) for obj_id in gets])
+        stats = User.cache_stats()
+        print(json.dumps({
+            "benchmark": "cache", "count": args.count, "gets": args.gets,
+            "cache_size": size, "size": stats['size'],
+            "hit_ratio": round(stats['hit_ratio'], 3),
+            "evictions": stats['evictions'],
+            "gets_per_second": round(args.gets / seconds)}))
+
+
+def bloom(args):
+    """ Time User.search of emails never saved, with and without the
+        Bloom filters (file storage only)
+    """
+    emails = ["missing{}@example.com".format(i) for i in range(args.lookups)]
+    os.chdir(tempfile.mkdtemp())
+    User.STORAGE = 'file'
+    User.load_from_file()
+    User.save_many(User(email="user{}@example.com".format(i))
+                   for i in range(args.count))
+    results = {"benchmark": "bloom", "count": args.count,
+               "lookups": args.lookups}
+    for error_rate in (0, 0.01):
+        User.BLOOM_ERROR_RATE = error_rate
+        BLOOM_FILTERS.clear()
+        User.search({'email': "user0@example.com"})
+        seconds = timed(lambda: [User.search({'email': email})
+                                 for email in emails])
+        results["us_per_lookup_{}".format(error_rate)] = round(
+            seconds / args.lookups * 1e6, 2)
+    stats = User.bloom_stats()
+    results["rejected"] = stats['rejected']
+    results["unmatched"] = stats['unmatched']
+    print(json.dumps(results))
+
+
+def main():
+    """ Parse the command line and run one benchmark
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest='command', required=True)
+    command = commands.add_parser('memory', help=memory.__doc__.strip())
+    command.add_argument('--count', type=int, default=50000)
+    command.set_defaults(func=memory)
+    command = commands.add_parser('load', help=load.__doc__.strip())
+    command.add_argument('--count', type=int, default=100000)
+    command.set_defaults(func=load)
+    command = commands.add_parser('stress', help=stress.__doc__.strip())
+    command.add_argument('--threads', type=int, default=200)
+    command.add_argument('--operations', type=int, default=20)
+    command.add_argument('--durability', choices=('always', 'deferred'),
+                         default=User.DURABILITY)
+    command.add_argument('--journal', action='store_true',
+                         default=User.JOURNAL)
+    command.set_defaults(func=stress)
+    command = commands.add_parser('coherence',
+                                  help=coherence.__doc__.strip())
+    command.add_argument('--processes', type=int, default=8)
+    command.add_argument('--operations', type=int, default=200)
+    command.add_argument('--durability', choices=('always', 'deferred'),
+                         default=User.DURABILITY)
+    command.add_argument('--journal', action='store_true',
+                         default=User.JOURNAL)
+    command.set_defaults(func=coherence)
+    command = commands.add_parser('bulk', help=bulk.__doc__.strip())
+    command.add_argument('--counts', type=int, nargs='+',
+                         default=[10000, 100000])
+    command.add_argument('--sample', type=int, default=1000,
+                         help="objects saved one by one (quadratic)")
+    command.set_defaults(func=bulk)
+    command = commands.add_parser('serialize',
+                                  help=serialize.__doc__.strip())
+    command.add_argument('--count', type=int, default=100000)
+    command.add_argument('--changed', type=int, default=1,
+                         help="percentage of users changed between saves")
+    command.set_defaults(func=serialize)
+    command = commands.add_parser('cache', help=cache.__doc__.strip())
+    command.add_argument('--count', type=int, default=100000)
+    command.add_argument('--gets', type=int, default=200000)
+    command.add_argument('--sizes', type=int, nargs='+',
+                         default=[0, 1000, 20000, 100000])
+    command.set_defaults(func=cache)
+    command = commands.add_parser('bloom', help=bloom.__doc__.strip())
+    command.add_argument('--count', type=int, default=100000)
+    command.add_argument('--lookups', type=int, default=100000)
+    command.set_defaults(func=bloom)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
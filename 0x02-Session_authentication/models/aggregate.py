@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+""" Aggregate module
+"""
+from typing import Callable, Iterable, TypeVar
+import threading
+
+
+# Aggregates of each model class, by class name
+AGGREGATES = {}
+
+
+class Aggregate():
+    """ Number of objects of a class in each group, key(obj) returning
+        the group of an object, None to leave it out
+        The group of each object is remembered, so that saving it again
+        moves it from its former group to its new one: an aggregate holds
+        one entry per object, which is why only the file storage, that
+        keeps every object in memory anyway, maintains them.
+    """
+
+    def __init__(self, key: Callable[[TypeVar('Base')], object]):
+        """ Initialize an empty Aggregate
+        """
+        self.key = key
+        self.counts = {}
+        self.groups = {}
+
+    def add(self, obj: TypeVar('Base')):
+        """ Count an object in its current group
+        """
+        group = self.key(obj)
+        self.discard(obj.id)
+        if group is None:
+            return
+        self.counts[group] = self.counts.get(group, 0) + 1
+        self.groups[obj.id] = group
+
+    def discard(self, obj_id: str):
+        """ Stop counting an object
+        """
+        if obj_id not in self.groups:
+            return
+        group = self.groups.pop(obj_id)
+        count = self.counts[group] - 1
+        if count == 0:
+            del self.counts[group]
+        else:
+            self.counts[group] = count
+
+    def count(self, group) -> int:
+        """ Return the number of objects in a group
+        """
+        return self.counts.get(group, 0)
+
+    def between(self, low: int, high: int) -> int:
+        """ Return the number of objects in the integer groups from low
+            to high excluded, reading at most as many groups as exist
+        """
+        counts = self.counts
+        if high - low <= len(counts):
+            return sum(counts.get(group, 0) for group in range(low, high))
+        return sum(count for group, count in list(counts.items())
+                   if low <= group < high)
+
+    def size(self) -> int:
+        """ Return the number of non-empty groups
+        """
+        return len(self.counts)
+
+    def objects(self) -> int:
+        """ Return the number of objects counted
+        """
+        return len(self.groups)
+
+
+class Aggregates():
+    """ The aggregates of one model class, name -> Aggregate
+        They are built by a single scan of the objects on first use and
+        then kept up to date by add and discard, which do nothing before.
+    """
+
+    def __init__(self, keys: dict):
+        """ Initialize the aggregates of keys, name -> group function
+        """
+        self.keys = keys
+        self.aggregates = None
+        self.lock = threading.Lock()
+
+    def get(self, name: str,
+            objects: Callable[[], Iterable[TypeVar('Base')]]) -> Aggregate:
+        """ Return an aggregate, counting objects() first if needed
+            Raise KeyError if the class has no aggregate of that name
+        """
+        with self.lock:
+            if self.aggregates is None:
+                aggregates = {name: Aggregate(key)
+                              for name, key in self.keys.items()}
+                for obj in objects():
+                    for aggregate in aggregates.values():
+                        aggregate.add(obj)
+                self.aggregates = aggregates
+            return self.aggregates[name]
+
+    def add(self, objs: Iterable[TypeVar('Base')]):
+        """ Count saved objects in their current groups
+        """
+        with self.lock:
+            if self.aggregates is None:
+                return
+            for obj in objs:
+                for aggregate in self.aggregates.values():
+                    aggregate.add(obj)
+
+    def discard(self, ids: Iterable[str]):
+        """ Stop counting removed objects
+        """
+        with self.lock:
+            if self.aggregates is None:
+                return
+            for obj_id in ids:
+                for aggregate in self.aggregates.values():
+                    aggregate.discard(obj_id)
+
+    def reset(self):
+        """ Forget every count, they are built again on next use
+        """
+        with self.lock:
+            self.aggregates = None
@@ -1,39 +1,231 @@
 #!/usr/bin/env python3
 """ Base module
 """
-from datetime import datetime
-from typing import TypeVar, List, Iterable
-from os import path
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import TypeVar, List, Iterable, Iterator, Union
+from os import getenv
+import calendar
 import json
+import time
 import uuid
+from models.aggregate import AGGREGATES, Aggregate, Aggregates
+from models.bloom import BLOOM_FILTERS, BloomFilters
+from models.engine.file_storage import DATA, FileStorage
+from models.engine.sqlite_storage import SQLiteStorage
+from models.engine.storage import Storage
+from models.query import Query
 
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
-DATA = {}
+EPOCH = datetime(1970, 1, 1)
+ATTRIBUTES = {}
+# Slots caching the serialized object and counting its changes, kept
+# when set
+CACHES = ('_json', '_json_text', '_version')
+BACKENDS = {
+    'file': FileStorage,
+    'sqlite': SQLiteStorage,
+}
+STORAGES = {}
+
+
+@lru_cache(maxsize=4096)
+def parse_timestamp(value: str) -> int:
+    """ Convert a TIMESTAMP_FORMAT date to seconds since the epoch
+    """
+    return calendar.timegm(datetime.fromisoformat(value).utctimetuple())
+
+
+@lru_cache(maxsize=4096)
+def format_timestamp(value: int) -> str:
+    """ Convert seconds since the epoch to a TIMESTAMP_FORMAT date
+    """
+    return time.strftime(TIMESTAMP_FORMAT, time.gmtime(value))
 
 
 class Base():
     """ Base class
+
+        Instances have no __dict__ when their class declares __slots__,
+        and keep their timestamps as integer seconds since the epoch.
+        Their to_json(True) dictionary and its JSON text are cached until
+        an attribute is set: values changed in place (a list appended to)
+        must be set again to be seen. Setting an attribute also bumps
+        _version, so that a cache built meanwhile by another thread is
+        not kept.
     """
 
+    __slots__ = ('id', '_created_at', '_updated_at') + CACHES
+
+    # Storage backend, one of BACKENDS
+    STORAGE = getenv('MODELS_STORAGE', 'file')
+    # Attributes with a secondary index, used by search
+    INDEXES = ()
+    # Log each save/remove to .db_<class>.journal instead of rewriting
+    # .db_<class>.json, which is compacted past JOURNAL_MAX_BYTES
+    JOURNAL = getenv('MODELS_JOURNAL', '0') == '1'
+    JOURNAL_MAX_BYTES = 1024 * 1024
+    # 'always' persists every save/remove before returning, 'deferred'
+    # coalesces them into one write every FLUSH_INTERVAL seconds or
+    # FLUSH_EVERY mutations (bounded staleness, see flush)
+    DURABILITY = getenv('MODELS_DURABILITY', 'always')
+    FLUSH_INTERVAL = 1.0
+    FLUSH_EVERY = 100
+    # Keep the raw JSON of loaded objects and build each one on first use
+    LAZY_LOAD = getenv('MODELS_LAZY_LOAD', '0') == '1'
+    # Also write .db_<class>.snap, a binary copy of .db_<class>.json
+    # read instead of it at load time while it is up to date
+    SNAPSHOT = getenv('MODELS_SNAPSHOT', '0') == '1'
+    # Share the files with other processes: look for their changes on
+    # each access and lock the files while writing (file storage only)
+    COHERENT = getenv('MODELS_COHERENT', '0') == '1'
+    # Objects kept in memory by the sqlite storage, the least recently
+    # used ones are evicted and read again from the database on demand
+    CACHE_SIZE = int(getenv('MODELS_CACHE_SIZE', '10000'))
+    # Counts of objects per group, name -> function returning the group
+    # of an object (None for no group), see aggregate; they only count
+    # the changes of this process, so they are kept with the file storage
+    # outside of COHERENT mode only
+    AGGREGATES = {}
+    # Error rate of the Bloom filters of INDEXES, with which searches of
+    # string values never saved return without reading the store; 0
+    # disables them. They only know the saves of this process, so they
+    # are used with the file storage outside of COHERENT mode only (an
+    # sqlite database is shared by every process opening it)
+    BLOOM_ERROR_RATE = float(getenv('MODELS_BLOOM_ERROR_RATE', '0.01'))
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
         s_class = str(self.__class__.__name__)
         if DATA.get(s_class) is None:
-            DATA[s_class] = {}
+            DATA.setdefault(s_class, {})
 
+        self._version = 0
+        self._json = None
+        self._json_text = None
         self.id = kwargs.get('id', str(uuid.uuid4()))
         if kwargs.get('created_at') is not None:
-            self.created_at = datetime.strptime(kwargs.get('created_at'),
-                                                TIMESTAMP_FORMAT)
+            self._created_at = parse_timestamp(kwargs.get('created_at'))
         else:
-            self.created_at = datetime.utcnow()
+            self._created_at = int(time.time())
         if kwargs.get('updated_at') is not None:
-            self.updated_at = datetime.strptime(kwargs.get('updated_at'),
-                                                TIMESTAMP_FORMAT)
+            self._updated_at = parse_timestamp(kwargs.get('updated_at'))
         else:
-            self.updated_at = datetime.utcnow()
+            self._updated_at = int(time.time())
+
+    @classmethod
+    def from_json(cls, obj_json: dict) -> TypeVar('Base'):
+        """ Build an object from its to_json(True) dictionary
+            Classes declaring __slots__ all the way down skip __init__
+            and get every slot set straight from the dictionary
+        """
+        if cls.__dictoffset__ != 0:
+            return cls(**obj_json)
+        obj = cls.__new__(cls)
+        set_slot = object.__setattr__
+        get = obj_json.get
+        set_slot(obj, 'id',
+                 obj_json['id'] if 'id' in obj_json else str(uuid.uuid4()))
+        value = get('created_at')
+        set_slot(obj, '_created_at', parse_timestamp(value)
+                 if value is not None else int(time.time()))
+        value = get('updated_at')
+        set_slot(obj, '_updated_at', parse_timestamp(value)
+                 if value is not None else int(time.time()))
+        set_slot(obj, '_version', 0)
+        set_slot(obj, '_json', None)
+        set_slot(obj, '_json_text', None)
+        for name in cls.attribute_names():
+            set_slot(obj, name, get(name))
+        return obj
+
+    @classmethod
+    def from_row(cls, row: tuple) -> TypeVar('Base'):
+        """ Build an object from its to_row tuple
+        """
+        obj = cls.__new__(cls)
+        set_slot = object.__setattr__
+        for name, value in zip(('id', '_created_at', '_updated_at'), row):
+            set_slot(obj, name, value)
+        set_slot(obj, '_version', 0)
+        set_slot(obj, '_json', None)
+        set_slot(obj, '_json_text', None)
+        for name, value in zip(cls.attribute_names(), row[3:]):
+            set_slot(obj, name, value)
+        return obj
+
+    def to_row(self) -> tuple:
+        """ Convert the object to a tuple: ID, timestamps as integers and
+            the value of each slot of attribute_names
+        """
+        return (self.id, self._created_at, self._updated_at) + tuple(
+            getattr(self, name, None)
+            for name in self.__class__.attribute_names())
+
+    def __setattr__(self, name: str, value):
+        """ Set an attribute and drop the cached JSON of the object
+        """
+        object.__setattr__(self, name, value)
+        if name not in CACHES:
+            self._changed()
+
+    def __delattr__(self, name: str):
+        """ Delete an attribute and drop the cached JSON of the object
+        """
+        object.__delattr__(self, name)
+        self._changed()
+
+    def _changed(self):
+        """ Bump the version of the object, then drop its cached JSON
+            Bumped first: a thread that read the former version before
+            building the JSON sees the change once it has cached it
+        """
+        object.__setattr__(self, '_version',
+                           getattr(self, '_version', 0) + 1)
+        object.__setattr__(self, '_json', None)
+        object.__setattr__(self, '_json_text', None)
+
+    @property
+    def created_at(self) -> datetime:
+        """ Getter of the creation date
+        """
+        return EPOCH + timedelta(seconds=self._created_at)
+
+    @created_at.setter
+    def created_at(self, value: datetime):
+        """ Setter of the creation date
+        """
+        self._created_at = calendar.timegm(value.utctimetuple())
+
+    @property
+    def updated_at(self) -> datetime:
+        """ Getter of the last update date
+        """
+        return EPOCH + timedelta(seconds=self._updated_at)
+
+    @updated_at.setter
+    def updated_at(self, value: datetime):
+        """ Setter of the last update date
+        """
+        self._updated_at = calendar.timegm(value.utctimetuple())
+
+    @classmethod
+    def attribute_names(cls) -> tuple:
+        """ Return the names of the slots declared by the subclasses
+        """
+        names = ATTRIBUTES.get(cls)
+        if names is None:
+            names = []
+            for klass in reversed(cls.__mro__[:cls.__mro__.index(Base)]):
+                slots = klass.__dict__.get('__slots__', ())
+                if isinstance(slots, str):
+                    slots = (slots,)
+                names.extend(name for name in slots
+                             if name not in ('__dict__', '__weakref__'))
+            names = ATTRIBUTES[cls] = tuple(names)
+        return names
 
     def __eq__(self, other: TypeVar('Base')) -> bool:
         """ Equality
@@ -44,69 +236,230 @@ class Base():
             return False
         return (self.id == other.id)
 
-    def to_json(self, for_serialization: bool = False) -> dict:
-        """ Convert the object a JSON dictionary
+    def _build_json(self) -> dict:
+        """ Build the to_json(True) dictionary of the object
         """
-        result = {}
-        for key, value in self.__dict__.items():
-            if not for_serialization and key[0] == '_':
-                continue
+        result = {
+            'id': self.id,
+            'created_at': format_timestamp(self._created_at),
+            'updated_at': format_timestamp(self._updated_at),
+        }
+        items = []
+        for key in self.__class__.attribute_names():
+            if hasattr(self, key):
+                items.append((key, getattr(self, key)))
+        items.extend(getattr(self, '__dict__', {}).items())
+        for key, value in items:
             if type(value) is datetime:
                 result[key] = value.strftime(TIMESTAMP_FORMAT)
             else:
                 result[key] = value
         return result
 
+    def to_json(self, for_serialization: bool = False) -> dict:
+        """ Convert the object a JSON dictionary
+        """
+        result = self._json
+        if result is None:
+            version = self._version
+            result = self._build_json()
+            self._json = result
+            if self._version != version:
+                # Changed while building: don't keep the stale copy
+                self._json = None
+        if for_serialization:
+            return dict(result)
+        return {key: value for key, value in result.items()
+                if key[0] != '_'}
+
+    def to_json_text(self) -> str:
+        """ Return the JSON text of to_json(True), cached as well
+        """
+        text = self._json_text
+        if text is None:
+            version = self._version
+            result = self._json
+            if result is None:
+                result = self._build_json()
+            text = self._json_text = json.dumps(result)
+            if self._version != version:
+                # Changed while serializing: don't keep the stale text
+                self._json_text = None
+        return text
+
+    @classmethod
+    def storage(cls) -> Storage:
+        """ Return the storage backend of the class
+        """
+        if STORAGES.get(cls.STORAGE) is None:
+            if cls.STORAGE not in BACKENDS:
+                raise ValueError("unknown storage: {}".format(cls.STORAGE))
+            STORAGES[cls.STORAGE] = BACKENDS[cls.STORAGE]()
+        return STORAGES[cls.STORAGE]
+
     @classmethod
     def load_from_file(cls):
         """ Load all objects from file
         """
-        s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
-            return
-
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+        cls.storage().load(cls)
+        cls.bloom_filters().reset()
+        if cls.AGGREGATES:
+            cls.aggregates().reset()
 
     @classmethod
     def save_to_file(cls):
         """ Save all objects to file
         """
-        s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        cls.storage().save_all(cls)
 
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+    @classmethod
+    def flush(cls):
+        """ Write the deferred operations of the class now
+        """
+        cls.storage().flush(cls)
+
+    @classmethod
+    def cache_stats(cls) -> dict:
+        """ Return the size, capacity, hits, misses and evictions of the
+            object cache of the class, empty if the storage has none
+        """
+        return cls.storage().cache_stats(cls)
 
     def save(self):
         """ Save current object
         """
-        s_class = self.__class__.__name__
-        self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        self._updated_at = int(time.time())
+        with self.__class__.bloom_filters().adding([self]):
+            self.__class__.storage().put(self)
+        if self.AGGREGATES:
+            self.__class__.aggregates().add([self])
 
     def remove(self):
         """ Remove object
         """
-        s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        if self.__class__.storage().delete(self):
+            self.__class__.bloom_filters().discard(1)
+        if self.AGGREGATES:
+            self.__class__.aggregates().discard([self.id])
+
+    @classmethod
+    def save_many(cls, objs: Iterable[TypeVar('Base')]):
+        """ Save objects of the class at once
+            All the objects are checked first: nothing is saved if one is
+            not an instance of the class. If the storage can't write
+            them, none is kept and the error is raised; in 'deferred'
+            DURABILITY they are written together on the next flush.
+        """
+        objs = list(objs)
+        for obj in objs:
+            if not isinstance(obj, cls):
+                raise TypeError("{} is not a {}".format(obj, cls.__name__))
+        if len(objs) == 0:
+            return
+        now = int(time.time())
+        for obj in objs:
+            obj._updated_at = now
+        with cls.bloom_filters().adding(objs):
+            cls.storage().put_many(cls, objs)
+        if cls.AGGREGATES:
+            cls.aggregates().add(objs)
+
+    @classmethod
+    def remove_many(cls, objs_or_ids: Iterable) -> int:
+        """ Remove objects of the class, given as objects or IDs, at once
+            and return how many were stored
+            Unknown IDs are ignored. Nothing is removed if an item is
+            neither an instance of the class nor a string, or if the
+            storage can't write the removal (see save_many).
+        """
+        ids = []
+        for item in objs_or_ids:
+            if isinstance(item, cls):
+                ids.append(item.id)
+            elif isinstance(item, str):
+                ids.append(item)
+            else:
+                raise TypeError("{} is not a {} nor an ID".format(
+                    item, cls.__name__))
+        if len(ids) == 0:
+            return 0
+        removed = cls.storage().delete_many(cls, ids)
+        cls.bloom_filters().discard(removed)
+        if cls.AGGREGATES:
+            cls.aggregates().discard(ids)
+        return removed
+
+    @classmethod
+    def count(cls, filter: dict = None) -> int:
+        """ Count all objects, or the ones matching filter (see query)
+        """
+        return cls.storage().count(cls, Query(filter) if filter else None)
 
     @classmethod
-    def count(cls) -> int:
-        """ Count all objects
+    def aggregates(cls) -> Aggregates:
+        """ Return the aggregates of the class
         """
-        s_class = cls.__name__
-        return len(DATA[s_class].keys())
+        aggregates = AGGREGATES.get(cls.__name__)
+        if aggregates is None:
+            # Other storages don't keep every object in memory, and
+            # aggregates keep an entry per object; in COHERENT mode they
+            # would miss the changes of other processes
+            kept = cls.STORAGE == 'file' and not cls.COHERENT
+            keys = cls.AGGREGATES if kept else {}
+            aggregates = AGGREGATES.setdefault(cls.__name__,
+                                               Aggregates(keys))
+        return aggregates
+
+    @classmethod
+    def aggregate(cls, name: str) -> Aggregate:
+        """ Return an aggregate of AGGREGATES, the number of objects in
+            each of its groups
+            It is counted by one scan on first use, or after
+            load_from_file, then kept up to date by save and remove of
+            this process.
+            Raise ValueError if the class doesn't use the file storage,
+            or is in COHERENT mode.
+        """
+        if cls.STORAGE != 'file' or cls.COHERENT:
+            raise ValueError("aggregates need the file storage outside "
+                             "of COHERENT mode")
+        return cls.aggregates().get(name, cls.query)
+
+    @classmethod
+    def bloom_filters(cls) -> BloomFilters:
+        """ Return the Bloom filters of the class
+        """
+        filters = BLOOM_FILTERS.get(cls.__name__)
+        if filters is None:
+            enabled = (cls.BLOOM_ERROR_RATE > 0 and cls.STORAGE == 'file'
+                       and not cls.COHERENT)
+            filters = BLOOM_FILTERS.setdefault(cls.__name__, BloomFilters(
+                cls.INDEXES if enabled else (), cls.BLOOM_ERROR_RATE))
+        return filters
+
+    @classmethod
+    def bloom_stats(cls) -> dict:
+        """ Return the counters of the Bloom filters of the class: lookups
+            checked, rejected without reading the store, and let through
+            but not found (unmatched: false positives, and values that
+            were changed or removed since they were saved)
+        """
+        return cls.bloom_filters().stats()
+
+    @classmethod
+    def query(cls, filter: dict = None,
+              order_by: Union[str, Iterable[str]] = None,
+              limit: int = None, offset: int = 0,
+              fields: Iterable[str] = None) -> Iterator:
+        """ Iterate lazily over the objects matching filter
+            filter keys are attribute names, optionally followed by one of
+            __eq, __ne, __lt, __lte, __gt, __gte, __startswith or __in;
+            order_by names attributes, "-" first for a descending order;
+            with fields, yield dictionaries of these keys of
+            to_json(True) instead of objects (see models.query.Query)
+        """
+        query = Query(filter, order_by, limit, offset, fields)
+        return cls.storage().query(cls, query)
 
     @classmethod
     def all(cls) -> Iterable[TypeVar('Base')]:
@@ -118,20 +471,19 @@ class Base():
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
         """
-        s_class = cls.__name__
-        return DATA[s_class].get(id)
+        return cls.storage().get(cls, id)
 
     @classmethod
     def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
+            A string value of an indexed attribute that was never saved
+            is answered by the Bloom filters of the class alone
         """
-        s_class = cls.__name__
-        def _search(obj):
-            if len(attributes) == 0:
-                return True
-            for k, v in attributes.items():
-                if (getattr(obj, k) != v):
-                    return False
-            return True
-        
-        return list(filter(_search, DATA[s_class].values()))
+        filters = cls.bloom_filters()
+        if not filters.may_match(attributes, lambda: cls.query(
+                fields=filters.attributes)):
+            return []
+        result = cls.storage().search(cls, attributes)
+        if len(result) == 0:
+            filters.missed(attributes)
+        return result
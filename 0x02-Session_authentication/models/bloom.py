@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+""" Bloom filter module
+"""
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, List, TypeVar
+import math
+import threading
+
+
+# Bloom filters of each model class, by class name
+BLOOM_FILTERS = {}
+# Fewest values a filter is sized for
+MIN_CAPACITY = 1024
+
+
+class BloomFilter():
+    """ Set of values that can tell for sure a value was never added,
+        and wrongly says it was with a probability of error_rate as long
+        as at most capacity values were added
+        Values are located by their hash(), so equal values are found
+        whatever their type; the filter lives in one process only.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        """ Initialize an empty BloomFilter
+        """
+        size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.size = max(8, size)
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value) -> Iterator[int]:
+        """ Return the bits of a value (double hashing)
+        """
+        first = hash(value)
+        step = hash((value, self.size)) | 1
+        for i in range(self.hashes):
+            yield (first + i * step) % self.size
+
+    def add(self, value):
+        """ Add a value
+        """
+        bits = self.bits
+        for position in self._positions(value):
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value) -> bool:
+        """ Tell if a value may have been added
+        """
+        bits = self.bits
+        for position in self._positions(value):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class BloomFilters():
+    """ A BloomFilter per attribute of a model class, holding the string
+        values saved for it, to answer searches of values never saved
+        without reading the store
+
+        Removing a value would need the value last saved for each object,
+        so removed values stay in the filters; they are built again by a
+        single scan of the store on first use, and when more values were
+        added than they were sized for (twice the objects of the last
+        scan), which drops the removed ones.
+    """
+
+    def __init__(self, attributes: Iterable[str], error_rate: float):
+        """ Initialize the filters of attributes, built on first use
+        """
+        self.attributes = tuple(attributes)
+        self.error_rate = error_rate
+        self.filters = None
+        self.capacity = 0
+        self.added = 0
+        self.lock = threading.Lock()
+        self.lookups = 0
+        self.rejected = 0
+        self.unmatched = 0
+        self.removed = 0
+        self.builds = 0
+
+    def _build(self, rows: Iterable[dict]):
+        """ Fill new filters with rows, dictionaries of the attributes
+            Called with self.lock held.
+        """
+        rows = list(rows)
+        self.capacity = max(MIN_CAPACITY, 2 * len(rows))
+        self.filters = {attribute: BloomFilter(self.capacity,
+                                               self.error_rate)
+                        for attribute in self.attributes}
+        for row in rows:
+            self._add(row)
+        self.added = len(rows)
+        self.builds += 1
+
+    def _add(self, values: dict):
+        """ Add the string values of an object, by attribute
+            Called with self.lock held.
+        """
+        for attribute, bloom_filter in self.filters.items():
+            value = values.get(attribute)
+            if type(value) is str:
+                bloom_filter.add(value)
+
+    def add(self, objs: Iterable[TypeVar('Base')], new: bool = True):
+        """ Add the values of objects about to be saved, or just saved
+            when new is False (they were added before being saved)
+        """
+        if not self.attributes:
+            return
+        with self.lock:
+            if self.filters is None:
+                return
+            for obj in objs:
+                self._add({attribute: getattr(obj, attribute, None)
+                           for attribute in self.attributes})
+                if new:
+                    self.added += 1
+            if self.added > self.capacity:
+                # Past capacity the error rate grows: build on next use
+                self.filters = None
+
+    @contextmanager
+    def adding(self, objs: List[TypeVar('Base')]) -> Iterator[None]:
+        """ Add the values of objects before and after they are written
+            by the block: searches find them while they are written, and
+            a build scanning the store meanwhile doesn't lose them
+        """
+        self.add(objs)
+        yield
+        self.add(objs, False)
+
+    def discard(self, count: int):
+        """ Count removed objects, their values stay in the filters
+        """
+        with self.lock:
+            self.removed += count
+
+    def _checked(self, attributes: dict) -> list:
+        """ Return the (attribute, value) pairs the filters can check
+        """
+        return [(attribute, value) for attribute, value in attributes.items()
+                if attribute in self.attributes and type(value) is str]
+
+    def may_match(self, attributes: dict,
+                  rows: Callable[[], Iterable[dict]]) -> bool:
+        """ Tell if objects may have these attributes, False if one of
+            the string values was never saved
+            rows() returns the values of the attributes of every object
+            when the filters must be built.
+        """
+        checked = self._checked(attributes)
+        if not checked:
+            return True
+        with self.lock:
+            if self.filters is None:
+                self._build(rows())
+            self.lookups += 1
+            for attribute, value in checked:
+                if value not in self.filters[attribute]:
+                    self.rejected += 1
+                    return False
+        return True
+
+    def missed(self, attributes: dict):
+        """ Count a search the filters let through that found nothing:
+            a false positive, or a value changed or removed since saved
+        """
+        if not self._checked(attributes):
+            return
+        with self.lock:
+            self.unmatched += 1
+
+    def reset(self):
+        """ Drop the filters, they are built again on next use
+        """
+        with self.lock:
+            self.filters = None
+
+    def stats(self) -> dict:
+        """ Return the counters of the filters
+        """
+        with self.lock:
+            return {'attributes': list(self.attributes),
+                    'error_rate': self.error_rate,
+                    'capacity': self.capacity, 'added': self.added,
+                    'removed': self.removed, 'builds': self.builds,
+                    'lookups': self.lookups, 'rejected': self.rejected,
+                    'unmatched': self.unmatched}
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+""" Object cache module
+"""
+from collections import OrderedDict
+from typing import TypeVar
+
+
+class ObjectCache():
+    """ The most recently used objects of one class, by ID, at most
+        capacity of them, with hit/miss/eviction statistics
+        A capacity of 0 caches nothing.
+    """
+
+    def __init__(self, capacity: int):
+        """ Initialize an empty ObjectCache
+        """
+        self.capacity = capacity
+        self.objects = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, obj_id: str) -> TypeVar('Base'):
+        """ Return a cached object, None if it isn't cached
+        """
+        obj = self.objects.get(obj_id)
+        if obj is None:
+            self.misses += 1
+            return None
+        self.objects.move_to_end(obj_id)
+        self.hits += 1
+        return obj
+
+    def put(self, obj: TypeVar('Base')):
+        """ Cache an object, evicting the least recently used ones
+        """
+        if self.capacity <= 0:
+            return
+        self.objects[obj.id] = obj
+        self.objects.move_to_end(obj.id)
+        while len(self.objects) > self.capacity:
+            self.objects.popitem(last=False)
+            self.evictions += 1
+
+    def discard(self, obj_id: str):
+        """ Forget an object
+        """
+        self.objects.pop(obj_id, None)
+
+    def clear(self):
+        """ Forget every object, statistics are kept
+        """
+        self.objects.clear()
+
+    def stats(self) -> dict:
+        """ Return the size, capacity and statistics of the cache
+        """
+        lookups = self.hits + self.misses
+        return {'size': len(self.objects), 'capacity': self.capacity,
+                'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else None}
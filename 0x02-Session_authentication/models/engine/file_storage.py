@@ -0,0 +1,705 @@
+#!/usr/bin/env python3
+""" File storage module
+"""
+from typing import TypeVar, List, Iterable, Iterator, Tuple
+from os import path
+import gc
+import json
+import os
+from models.engine.storage import Storage
+from models.file_lock import FileLock
+from models.flusher import FLUSHER
+from models.index import Index
+from models.journal import Journal, write_atomic
+from models.query import Query
+from models.rwlock import RWLock
+from models import snapshot
+
+
+DATA = {}
+INDEX_DATA = {}
+JOURNALS = {}
+LOCKS = {}
+SNAPSHOTS = {}
+FILE_LOCKS = {}
+# Files last seen by each class in COHERENT mode
+SEEN = {}
+
+
+def _stat(file_path: str) -> tuple:
+    """ Return the (inode, mtime_ns, size) of a file, None if missing
+    """
+    try:
+        st = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+class FileStorage(Storage):
+    """ Default storage: every object in DATA, persisted to
+        .db_<class>.json (and .db_<class>.journal in JOURNAL mode,
+        .db_<class>.snap in SNAPSHOT mode)
+
+        The objects and indexes of a class are changed under the write
+        side of its lock. Readers copy what they need under the read side
+        then work on the copy: all() and search() share a read-only copy
+        of the objects, made on the first read after a change. Writers
+        hold the journal lock of the class from their change in memory
+        until it is written or deferred, so that the files get the
+        changes in the order they were made in memory.
+
+        In COHERENT mode, several processes share the files: every access
+        first compares the files with the ones last seen, then reads what
+        other processes changed, only the new journal entries when
+        possible. Readers hold .db_<class>.lock shared, and writers hold
+        it alone while they catch up and write.
+    """
+
+    def objects(self, cls) -> dict:
+        """ Return the objects of a class, by ID
+        """
+        s_class = cls.__name__
+        if DATA.get(s_class) is None:
+            DATA.setdefault(s_class, {})
+        return DATA[s_class]
+
+    def indexes(self, cls) -> dict:
+        """ Return the secondary indexes of a class, by attribute
+        """
+        s_class = cls.__name__
+        if INDEX_DATA.get(s_class) is None:
+            INDEX_DATA.setdefault(s_class, {attr: Index(attr)
+                                            for attr in cls.INDEXES})
+        return INDEX_DATA[s_class]
+
+    def lock(self, cls) -> RWLock:
+        """ Return the readers-writer lock of a class
+        """
+        s_class = cls.__name__
+        if LOCKS.get(s_class) is None:
+            LOCKS.setdefault(s_class, RWLock())
+        return LOCKS[s_class]
+
+    def snapshot(self, cls) -> dict:
+        """ Return a copy of the objects of a class, by ID, that is never
+            changed: the same copy is shared until the next change
+        """
+        s_class = cls.__name__
+        objs = SNAPSHOTS.get(s_class)
+        if objs is None:
+            with self.lock(cls).read():
+                objs = SNAPSHOTS[s_class] = dict(self.objects(cls))
+        return objs
+
+    def changed(self, cls):
+        """ Drop the shared copy of the objects of a class, called under
+            the write lock after every change
+        """
+        SNAPSHOTS.pop(cls.__name__, None)
+
+    def reindex(self, cls):
+        """ Rebuild the secondary indexes of a class from all its objects
+        """
+        objs = self.objects(cls)
+        for index in self.indexes(cls).values():
+            value = self.value_getter(cls, index.attribute)
+            index.build((obj_id, value(obj), obj)
+                        for obj_id, obj in objs.items())
+
+    def value_getter(self, cls, attribute: str):
+        """ Return a function reading an attribute from an entry of DATA:
+            an object, or the raw JSON or row left by a lazy load
+        """
+        names = cls.attribute_names()
+        position = 3 + names.index(attribute) if attribute in names else None
+        if attribute == 'id':
+            position = 0
+
+        def value(obj):
+            if type(obj) is dict:
+                return obj.get(attribute)
+            if type(obj) is tuple:
+                return obj[position] if position is not None else None
+            return getattr(obj, attribute, None)
+        return value
+
+    def materialize(self, cls, obj_id: str, obj) -> TypeVar('Base'):
+        """ Return the object of an entry of DATA, building it first if
+            a lazy load left its raw JSON or row there
+        """
+        if type(obj) is dict:
+            built = cls.from_json(obj)
+        elif type(obj) is tuple:
+            built = cls.from_row(obj)
+        else:
+            return obj
+        with self.lock(cls).write():
+            objs = self.objects(cls)
+            current = objs.get(obj_id)
+            if current is obj:
+                objs[obj_id] = built
+                for index in self.indexes(cls).values():
+                    index.add(built)
+                self.changed(cls)
+            elif current is not None and type(current) not in (dict, tuple):
+                # Built by another thread meanwhile
+                built = current
+        return built
+
+    def serialize(self, cls, obj) -> dict:
+        """ Return the to_json(True) dictionary of an entry of DATA
+        """
+        if type(obj) is dict:
+            return obj
+        if type(obj) is tuple:
+            obj = cls.from_row(obj)
+        return obj.to_json(True)
+
+    def serialize_text(self, cls, obj) -> str:
+        """ Return the JSON text of an entry of DATA, cached by objects
+            until they change
+        """
+        if type(obj) is dict:
+            return json.dumps(obj)
+        if type(obj) is tuple:
+            obj = cls.from_row(obj)
+        return obj.to_json_text()
+
+    def journal(self, cls) -> Journal:
+        """ Return the journal of a class
+        """
+        s_class = cls.__name__
+        if JOURNALS.get(s_class) is None:
+            JOURNALS[s_class] = Journal(
+                ".db_{}.journal".format(s_class),
+                ".db_{}.json".format(s_class),
+                lambda obj: self.serialize_text(cls, obj),
+                lambda objs: self.save_snapshot(cls, objs))
+        return JOURNALS[s_class]
+
+    def snapshots(self, cls) -> bool:
+        """ Tell if the binary snapshot is used for a class: SNAPSHOT is
+            set and every attribute is a slot
+        """
+        return cls.SNAPSHOT and cls.__dictoffset__ == 0
+
+    def save_snapshot(self, cls, objs: dict):
+        """ Write the binary snapshot of objs, which .db_<class>.json
+            must already hold
+        """
+        if not self.snapshots(cls):
+            return
+        s_class = cls.__name__
+        rows = []
+        for obj in objs.values():
+            if type(obj) is dict:
+                obj = cls.from_json(obj)
+            rows.append(obj if type(obj) is tuple else obj.to_row())
+        snapshot.write(".db_{}.snap".format(s_class),
+                       ".db_{}.json".format(s_class),
+                       cls.attribute_names(), rows)
+
+    def load(self, cls):
+        """ Load all objects of a class from file
+            The garbage collector is paused meanwhile: the objects built
+            hold no cycles, and collections triggered by each batch of
+            allocations would scan the whole store again and again
+        """
+        self.flush(cls)
+        if cls.COHERENT:
+            with self.journal(cls).lock, self.file_lock(cls).hold(False):
+                self.replace(cls, self.read(cls))
+                self.seen(cls)
+        else:
+            self.replace(cls, self.read(cls))
+
+    def replace(self, cls, objs: dict):
+        """ Replace all objects of a class, then apply the deferred
+            operations not written yet
+        """
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with self.lock(cls).write():
+                DATA[cls.__name__] = objs
+                self.reindex(cls)
+                self.changed(cls)
+        finally:
+            if gc_enabled:
+                gc.enable()
+        pending = FLUSHER.peek(cls)
+        if pending:
+            self.apply(cls, ((op, obj_id, obj)
+                             for obj_id, (op, obj) in pending.items()))
+
+    def apply(self, cls, changes: Iterable[Tuple[str, str, object]]):
+        """ Apply changes (op, id, obj) to the objects of a class, where obj
+            is an object or its raw JSON
+        """
+        indexes = [(index, self.value_getter(cls, index.attribute))
+                   for index in self.indexes(cls).values()]
+        with self.lock(cls).write():
+            objs = self.objects(cls)
+            for op, obj_id, obj in changes:
+                if op != 'put':
+                    objs.pop(obj_id, None)
+                    for index, value in indexes:
+                        index.discard(obj_id)
+                    continue
+                if type(obj) is dict and not cls.LAZY_LOAD:
+                    obj = cls.from_json(obj)
+                objs[obj_id] = obj
+                for index, value in indexes:
+                    index.put(obj_id, value(obj), obj)
+            self.changed(cls)
+
+    def file_lock(self, cls) -> FileLock:
+        """ Return the lock file shared by the processes using a class
+        """
+        s_class = cls.__name__
+        if FILE_LOCKS.get(s_class) is None:
+            FILE_LOCKS.setdefault(s_class,
+                                  FileLock(".db_{}.lock".format(s_class)))
+        return FILE_LOCKS[s_class]
+
+    def files(self, cls) -> tuple:
+        """ Return the state of the JSON file and of the journal of a class
+        """
+        s_class = cls.__name__
+        return (_stat(".db_{}.json".format(s_class)),
+                _stat(".db_{}.journal".format(s_class)))
+
+    def seen(self, cls, offset: int = None):
+        """ Remember the files of a class as read up to now, the journal
+            up to offset if given, else to its end
+        """
+        files = self.files(cls)
+        if offset is None:
+            offset = files[1][2] if files[1] is not None else 0
+        SEEN[cls.__name__] = (files, offset)
+
+    def refresh(self, cls):
+        """ Read the changes made to the files of a class by other
+            processes, in COHERENT mode
+        """
+        if not cls.COHERENT:
+            return
+        seen = SEEN.get(cls.__name__)
+        if seen is not None and seen[0] == self.files(cls):
+            return
+        with self.journal(cls).lock, self.file_lock(cls).hold(False):
+            self.catch_up(cls)
+
+    def catch_up(self, cls):
+        """ Read what changed in the files of a class since they were last
+            seen, the file lock being held
+        """
+        s_class = cls.__name__
+        seen = SEEN.get(s_class)
+        json_file, journal_file = self.files(cls)
+        if seen is not None and seen[0] == (json_file, journal_file):
+            return
+        (seen_json, seen_journal), offset = seen or ((None, None), 0)
+        if seen is None or json_file != seen_json or (
+                seen_journal is not None and (journal_file is None or
+                                              journal_file[0] !=
+                                              seen_journal[0])):
+            # Rewritten, or journal rotated: read everything again
+            self.replace(cls, self.read(cls))
+            self.seen(cls)
+            return
+        entries, offset = self.journal(cls).entries(
+            ".db_{}.journal".format(s_class),
+            offset if seen_journal is not None else 0)
+        self.apply(cls, ((entry['op'], entry['id'], entry.get('obj'))
+                         for entry in entries))
+        pending = FLUSHER.peek(cls)
+        if pending:
+            self.apply(cls, ((op, obj_id, obj)
+                             for obj_id, (op, obj) in pending.items()))
+        self.seen(cls, offset)
+
+    def read(self, cls) -> dict:
+        """ Read all objects of a class from file, by ID
+            The binary snapshot is read instead of the JSON when it is up
+            to date. With LAZY_LOAD, objects are built on first access only
+        """
+        s_class = cls.__name__
+        file_path = ".db_{}.json".format(s_class)
+        objs = {}
+        rows = None
+        if self.snapshots(cls):
+            rows = snapshot.read(".db_{}.snap".format(s_class), file_path,
+                                 cls.attribute_names())
+        if rows is not None and cls.LAZY_LOAD:
+            objs = {row[0]: row for row in rows}
+        elif rows is not None:
+            from_row = cls.from_row
+            objs = {row[0]: from_row(row) for row in rows}
+        elif path.exists(file_path):
+            with open(file_path, 'r') as f:
+                objs = json.load(f)
+            if not cls.LAZY_LOAD:
+                from_json = cls.from_json
+                objs = {obj_id: from_json(obj_json)
+                        for obj_id, obj_json in objs.items()}
+
+        for entry in self.journal(cls).replay():
+            if entry['op'] != 'put':
+                objs.pop(entry['id'], None)
+            elif cls.LAZY_LOAD:
+                objs[entry['id']] = entry['obj']
+            else:
+                objs[entry['id']] = cls.from_json(entry['obj'])
+        return objs
+
+    def save_all(self, cls):
+        """ Save all objects of a class to file, through a temporary file
+            renamed over it
+        """
+        if cls.COHERENT:
+            with self.journal(cls).lock, self.file_lock(cls).hold(True):
+                self.catch_up(cls)
+                self.write_all(cls)
+                self.seen(cls)
+        else:
+            self.write_all(cls)
+
+    def write_all(self, cls):
+        """ Write all objects of a class to .db_<class>.json
+        """
+        s_class = cls.__name__
+        file_path = ".db_{}.json".format(s_class)
+        with self.journal(cls).lock:
+            # Copied under the journal lock: the last save writes the
+            # latest objects
+            objs = self.snapshot(cls)
+            # Objects unchanged since their last write reuse their text
+            write_atomic(file_path, "{" + ", ".join(
+                json.dumps(obj_id) + ": " + self.serialize_text(cls, obj)
+                for obj_id, obj in objs.items()) + "}")
+            self.save_snapshot(cls, objs)
+            self.journal(cls).reset()
+
+    def write(self, cls, op: str, obj: TypeVar('Base')):
+        """ Persist a 'put' or 'delete' of an object, now or on the next
+            flush depending on DURABILITY
+        """
+        self.write_many(cls, {obj.id: (op, obj)})
+
+    def write_many(self, cls, ops: dict):
+        """ Persist operations, given as {id: (op, obj)}, now or on the
+            next flush depending on DURABILITY
+        """
+        if cls.DURABILITY == 'deferred':
+            FLUSHER.mark_many(cls, ops)
+        else:
+            self.persist(cls, ops)
+
+    def persist(self, cls, ops: dict):
+        """ Write operations, given as {id: (op, obj)}, to the journal or
+            rewrite the whole file
+            In COHERENT mode, the changes of other processes are read
+            first and the operations applied over them
+        """
+        if not cls.COHERENT:
+            self.write_ops(cls, ops)
+            return
+        with self.journal(cls).lock, self.file_lock(cls).hold(True):
+            self.catch_up(cls)
+            self.apply(cls, ((op, obj_id, obj)
+                             for obj_id, (op, obj) in ops.items()))
+            self.write_ops(cls, ops)
+            self.seen(cls)
+
+    def write_ops(self, cls, ops: dict):
+        """ Write operations, given as {id: (op, obj)}
+        """
+        if not cls.JOURNAL:
+            self.write_all(cls)
+            return
+        entries = []
+        for obj_id, (op, obj) in ops.items():
+            entry = '{{"op": {}, "id": {}'.format(
+                json.dumps(op), json.dumps(obj_id))
+            if op == 'put':
+                entry += ', "obj": ' + obj.to_json_text()
+            entries.append(entry + '}')
+        if len(entries) > 1:
+            # One line: a torn write drops the whole batch
+            entries = ['{"op": "batch", "entries": [' + ", ".join(entries) +
+                       ']}']
+        if self.journal(cls).append(entries) <= cls.JOURNAL_MAX_BYTES:
+            return
+        if cls.COHERENT:
+            # Compacting in the background would race with the writes of
+            # other processes
+            self.write_all(cls)
+        else:
+            self.journal(cls).compact(lambda: self.snapshot(cls))
+
+    def flush(self, cls):
+        """ Write the deferred operations of a class now
+        """
+        # Taken under the journal lock, so that two flushes write their
+        # operations in the order they were taken
+        with self.journal(cls).lock:
+            ops = FLUSHER.take(cls)
+            if len(ops) == 0:
+                return
+            try:
+                self.persist(cls, ops)
+            except Exception:
+                FLUSHER.restore(cls, ops)
+                raise
+
+    def put(self, obj: TypeVar('Base')):
+        """ Insert or update an object
+        """
+        cls = obj.__class__
+        with self.journal(cls).lock:
+            with self.lock(cls).write():
+                self.objects(cls)[obj.id] = obj
+                for index in self.indexes(cls).values():
+                    index.add(obj)
+                self.changed(cls)
+            self.write(cls, 'put', obj)
+
+    def delete(self, obj: TypeVar('Base')) -> bool:
+        """ Remove an object
+        """
+        cls = obj.__class__
+        self.refresh(cls)
+        with self.journal(cls).lock:
+            with self.lock(cls).write():
+                objs = self.objects(cls)
+                if objs.get(obj.id) is None:
+                    return False
+                del objs[obj.id]
+                for index in self.indexes(cls).values():
+                    index.discard(obj.id)
+                self.changed(cls)
+            self.write(cls, 'delete', obj)
+        return True
+
+    def put_many(self, cls, objs: List[TypeVar('Base')]):
+        """ Insert or update objects of a class, persisted at once
+            If they can't be written right away, none of them is kept
+        """
+        with self.journal(cls).lock:
+            with self.lock(cls).write():
+                store = self.objects(cls)
+                previous = {obj.id: store.get(obj.id) for obj in objs}
+                for obj in objs:
+                    store[obj.id] = obj
+                for index in self.indexes(cls).values():
+                    for obj in objs:
+                        index.add(obj)
+                self.changed(cls)
+            try:
+                self.write_many(cls, {obj.id: ('put', obj) for obj in objs})
+            except Exception:
+                self.rollback(cls, {obj.id: (obj, previous[obj.id])
+                                    for obj in objs})
+                raise
+
+    def delete_many(self, cls, ids: List[str]) -> int:
+        """ Remove the objects of a class with these IDs, persisted at
+            once, and return how many were found
+            If they can't be written right away, none of them is removed
+        """
+        self.refresh(cls)
+        with self.journal(cls).lock:
+            with self.lock(cls).write():
+                store = self.objects(cls)
+                removed = {}
+                for obj_id in ids:
+                    obj = store.pop(obj_id, None)
+                    if obj is not None:
+                        removed[obj_id] = obj
+                for index in self.indexes(cls).values():
+                    for obj_id in removed:
+                        index.discard(obj_id)
+                self.changed(cls)
+            if len(removed) == 0:
+                return 0
+            try:
+                self.write_many(cls, {obj_id: ('delete', obj)
+                                      for obj_id, obj in removed.items()})
+            except Exception:
+                self.rollback(cls, {obj_id: (None, obj)
+                                    for obj_id, obj in removed.items()})
+                raise
+        return len(removed)
+
+    def rollback(self, cls, changes: dict):
+        """ Undo changes, given as {id: (new entry, previous entry)}, that
+            could not be written, unless the entries changed meanwhile
+        """
+        if cls.COHERENT:
+            # The files tell what was written: read them all again
+            SEEN.pop(cls.__name__, None)
+            return
+        with self.lock(cls).write():
+            store = self.objects(cls)
+            value_getters = [(index, self.value_getter(cls, index.attribute))
+                             for index in self.indexes(cls).values()]
+            for obj_id, (new, old) in changes.items():
+                if store.get(obj_id) is not new:
+                    continue
+                if old is None:
+                    store.pop(obj_id, None)
+                    for index, _ in value_getters:
+                        index.discard(obj_id)
+                    continue
+                store[obj_id] = old
+                for index, value in value_getters:
+                    index.put(obj_id, value(old), old)
+            self.changed(cls)
+
+    def count(self, cls, query: Query = None) -> int:
+        """ Count all objects of a class, or the ones matching a query
+            without building them
+        """
+        self.refresh(cls)
+        if query is None or not query.predicates:
+            return len(self.objects(cls))
+        entries = self.candidates(cls, query)
+        if entries is None:
+            entries = self.snapshot(cls)
+        return sum(1 for _ in self.matching(cls, query, entries.items()))
+
+    def candidates(self, cls, query: Query) -> dict:
+        """ Return the objects that the indexes select for the filter of
+            a query, by ID, the fewest of them, or None if no index helps
+        """
+        indexes = self.indexes(cls)
+        best = None
+        with self.lock(cls).read():
+            for attribute, op, value in query.predicates:
+                if attribute not in indexes:
+                    continue
+                try:
+                    objs = indexes[attribute].select(op, value)
+                except TypeError:
+                    continue
+                if objs is not None and (best is None or
+                                         len(objs) < len(best)):
+                    best = objs
+        return best
+
+    def ordered(self, cls, attribute: str,
+                descending: bool) -> Iterable[Tuple[str, object]]:
+        """ Return the (id, entry) of all objects in the order of an
+            indexed attribute, None values last, read one value at a time
+            Return None if some objects aren't in the index or the values
+            can't be compared
+        """
+        index = self.indexes(cls)[attribute]
+        with self.lock(cls).read():
+            if len(index.values) != len(self.objects(cls)):
+                return None
+            try:
+                values = list(index.sorted_values())
+            except TypeError:
+                return None
+        if descending:
+            values.reverse()
+        values.append(None)
+
+        def entries():
+            seen = set()
+            for value in values:
+                with self.lock(cls).read():
+                    bucket = list(index.lookup(value).items())
+                for obj_id, obj in bucket:
+                    # Moved to a later value while iterating
+                    if obj_id not in seen:
+                        seen.add(obj_id)
+                        yield obj_id, obj
+        return entries()
+
+    def matching(self, cls, query: Query,
+                 entries: Iterable[Tuple[str, object]]) -> Iterator[tuple]:
+        """ Yield the (id, entry) of entries matching the filter of a
+            query, reading raw entries without building objects when
+            the filter only reads slots
+        """
+        names = set(cls.attribute_names())
+        names.add('id')
+        raw_ok = query.attributes() <= names
+        values = {attribute: self.value_getter(cls, attribute)
+                  for attribute in query.attributes()}
+        for obj_id, obj in entries:
+            if type(obj) in (dict, tuple) and not raw_ok:
+                obj = self.materialize(cls, obj_id, obj)
+            if query.matches(lambda attribute: values[attribute](obj)):
+                yield obj_id, obj
+
+    def query(self, cls, query: Query) -> Iterator:
+        """ Iterate over the objects matching a query, or their fields
+            The filter goes through the smallest selection of an index,
+            and ordering by one indexed attribute walks its index
+        """
+        self.refresh(cls)
+        entries = self.candidates(cls, query)
+        ordered = False
+        if entries is not None:
+            entries = entries.items()
+        elif len(query.order_by) == 1 and \
+                query.order_by[0][0] in self.indexes(cls):
+            entries = self.ordered(cls, *query.order_by[0])
+            ordered = entries is not None
+        if entries is None:
+            entries = self.snapshot(cls).items()
+        matches = self.matching(cls, query, entries)
+        if query.order_by and not ordered:
+            matches = ((obj.id, obj) for obj in query.sort(
+                self.materialize(cls, obj_id, obj)
+                for obj_id, obj in matches))
+        for obj_id, obj in query.window(matches):
+            if query.fields is not None:
+                yield query.project(self.serialize(cls, obj))
+            else:
+                yield self.materialize(cls, obj_id, obj)
+
+    def get(self, cls, id: str) -> TypeVar('Base'):
+        """ Return one object by ID
+        """
+        self.refresh(cls)
+        with self.lock(cls).read():
+            obj = self.objects(cls).get(id)
+        if obj is None:
+            return None
+        return self.materialize(cls, id, obj)
+
+    def search(self, cls, attributes: dict) -> List[TypeVar('Base')]:
+        """ Search all objects with matching attributes
+            Use a secondary index when one of the attributes has one
+        """
+        def _search(obj):
+            if len(attributes) == 0:
+                return True
+            for k, v in attributes.items():
+                if (getattr(obj, k) != v):
+                    return False
+            return True
+
+        self.refresh(cls)
+        objs = None
+        indexes = self.indexes(cls)
+        for k, v in attributes.items():
+            if k not in indexes:
+                continue
+            try:
+                with self.lock(cls).read():
+                    objs = dict(indexes[k].lookup(v))
+            except TypeError:
+                continue
+            break
+        if objs is None:
+            objs = self.snapshot(cls)
+        objs = [self.materialize(cls, obj_id, obj)
+                for obj_id, obj in objs.items()]
+        return list(filter(_search, objs))
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+""" SQLite storage module
+"""
+from datetime import datetime
+from typing import TypeVar, Iterator, List
+from os import getenv
+import json
+import sqlite3
+import threading
+from models.cache import ObjectCache
+from models.engine.storage import Storage
+from models.query import Query, prefix_end
+
+
+# Rows read per statement by query()
+PAGE_SIZE = 500
+
+
+def _quote(name: str) -> str:
+    """ Quote an SQL identifier
+    """
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def _sql_value(value):
+    """ Convert a Python value to the value stored in SQLite
+    """
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    if isinstance(value, datetime):
+        from models.base import TIMESTAMP_FORMAT
+        return value.strftime(TIMESTAMP_FORMAT)
+    return json.dumps(value, separators=(',', ':'))
+
+
+class SQLiteStorage(Storage):
+    """ SQLite storage: one table per class with the JSON of each object,
+        a column and a real index per attribute of INDEXES, and every
+        query run in SQL so that only the CACHE_SIZE most recently used
+        objects of each class are kept in memory
+
+        Other processes may write to the same database: the caches are
+        emptied whenever PRAGMA data_version tells that one did, and
+        search and query always build their objects from the rows read.
+    """
+
+    def __init__(self, file_path: str = None):
+        """ Open the database, MODELS_SQLITE_PATH or .db.sqlite3
+        """
+        self.file_path = file_path or getenv('MODELS_SQLITE_PATH',
+                                             '.db.sqlite3')
+        self.connection = sqlite3.connect(self.file_path,
+                                          check_same_thread=False)
+        self.lock = threading.RLock()
+        self.tables = set()
+        self.caches = {}
+        self.data_version = self.connection.execute(
+            "PRAGMA data_version").fetchone()[0]
+
+    def table(self, cls) -> str:
+        """ Create the table of a class if needed, return its quoted name
+        """
+        s_class = cls.__name__
+        if s_class not in self.tables:
+            with self.lock, self.connection:
+                columns = "".join(", {} TEXT".format(_quote(attr))
+                                  for attr in cls.INDEXES)
+                self.connection.execute(
+                    "CREATE TABLE IF NOT EXISTS {} (id TEXT PRIMARY KEY, "
+                    "data TEXT NOT NULL{})".format(_quote(s_class), columns))
+                for attr in cls.INDEXES:
+                    self.connection.execute(
+                        "CREATE INDEX IF NOT EXISTS {} ON {} ({})".format(
+                            _quote("{}_{}".format(s_class, attr)),
+                            _quote(s_class), _quote(attr)))
+            self.tables.add(s_class)
+        return _quote(s_class)
+
+    def cache(self, cls) -> ObjectCache:
+        """ Return the object cache of a class
+        """
+        cache = self.caches.get(cls.__name__)
+        if cache is None:
+            cache = self.caches.setdefault(cls.__name__,
+                                           ObjectCache(cls.CACHE_SIZE))
+        return cache
+
+    def cache_stats(self, cls) -> dict:
+        """ Return the statistics of the object cache of a class
+        """
+        with self.lock:
+            return self.cache(cls).stats()
+
+    def _validate(self):
+        """ Empty every cache if another connection changed the database
+            since the last check
+            Called with self.lock held.
+        """
+        version = self.connection.execute(
+            "PRAGMA data_version").fetchone()[0]
+        if version != self.data_version:
+            for cache in self.caches.values():
+                cache.clear()
+            self.data_version = version
+
+    def _build(self, cls, row: tuple) -> TypeVar('Base'):
+        """ Build the object of an (id, data) row from its stored JSON and
+            cache it in place of the former one
+            Called with self.lock held.
+        """
+        obj = cls.from_json(json.loads(row[1]))
+        self.cache(cls).put(obj)
+        return obj
+
+    def _column(self, cls, attribute: str) -> tuple:
+        """ Return the SQL expression of an attribute and its parameters
+        """
+        if attribute == 'id' or attribute in cls.INDEXES:
+            return _quote(attribute), []
+        return "json_extract(data, ?)", [
+            '$."{}"'.format(attribute.replace('"', '\\"'))]
+
+    def _clause(self, column: tuple, op: str, value) -> tuple:
+        """ Return the SQL condition of a Query predicate on a column,
+            given as (expression, parameters), and its parameters, with
+            the NULL semantics of Query
+        """
+        sql, column_params = column
+        if op == 'eq' and value is None:
+            return "{} IS NULL".format(sql), column_params
+        if op == 'ne':
+            return "{} IS NOT ?".format(sql), column_params + [
+                _sql_value(value)]
+        if op == 'in':
+            values = [_sql_value(v) for v in value if v is not None]
+            clause = "{} IN ({})".format(sql, ", ".join("?" * len(values)))
+            params = column_params + values
+            if None in value:
+                clause = "({} OR {} IS NULL)".format(clause, sql)
+                params += column_params
+            return clause, params
+        if value is None:
+            return "0", []
+        if op == 'startswith':
+            if not isinstance(value, str):
+                return "0", []
+            end = prefix_end(value)
+            if end is None:
+                return "{} >= ?".format(sql), column_params + [value]
+            return "({0} >= ? AND {0} < ?)".format(sql), (
+                column_params + [value] + column_params + [end])
+        sql_op = {'eq': '=', 'lt': '<', 'lte': '<=', 'gt': '>',
+                  'gte': '>='}[op]
+        return "{} {} ?".format(sql, sql_op), column_params + [
+            _sql_value(value)]
+
+    def _where(self, cls, query: Query) -> tuple:
+        """ Return the WHERE clause of a query and its parameters
+        """
+        clauses = []
+        params = []
+        for attribute, op, value in query.predicates:
+            clause, clause_params = self._clause(
+                self._column(cls, attribute), op, value)
+            clauses.append(clause)
+            params.extend(clause_params)
+        if len(clauses) == 0:
+            return "", params
+        return " WHERE " + " AND ".join(clauses), params
+
+    def _order(self, cls, query: Query) -> tuple:
+        """ Return the ORDER BY clause of a query and its parameters,
+            None values last
+        """
+        terms = []
+        params = []
+        for attribute, descending in query.order_by:
+            column, column_params = self._column(cls, attribute)
+            terms.append("{0} IS NULL, {0}{1}".format(
+                column, " DESC" if descending else ""))
+            params.extend(column_params * 2)
+        terms.append("rowid")
+        return " ORDER BY " + ", ".join(terms), params
+
+    def _after(self, cls, query: Query, last: tuple) -> tuple:
+        """ Return the condition of the rows after a row in the order of
+            _order, and its parameters
+            last holds the values of the row for query.order_by, then its
+            rowid.
+        """
+        keys = []
+        for (attribute, descending), value in zip(query.order_by, last):
+            column, column_params = self._column(cls, attribute)
+            keys.append(("({} IS NULL)".format(column), column_params, False,
+                         int(value is None)))
+            keys.append((column, column_params, descending, value))
+        keys.append(("rowid", [], False, last[-1]))
+        # Lexicographic: equal on the first keys and after on the next one
+        clauses = []
+        params = []
+        equal = []
+        equal_params = []
+        for sql, sql_params, descending, value in keys:
+            if value is not None:
+                clauses.append(" AND ".join(equal + ["{} {} ?".format(
+                    sql, "<" if descending else ">")]))
+                params.extend(equal_params + sql_params + [value])
+            equal.append("{} IS ?".format(sql))
+            equal_params.extend(sql_params + [value])
+        return "({})".format(" OR ".join(
+            "({})".format(clause) for clause in clauses)), params
+
+    def load(self, cls):
+        """ Open the table of a class and empty its cache, objects are
+            read on demand
+        """
+        self.table(cls)
+        with self.lock:
+            self.cache(cls).clear()
+
+    def save_all(self, cls):
+        """ Every write is already committed
+        """
+        self.table(cls)
+
+    def put(self, obj: TypeVar('Base')):
+        """ Insert or update an object in one transaction
+        """
+        self.put_many(obj.__class__, [obj])
+
+    def put_many(self, cls, objs: List[TypeVar('Base')]):
+        """ Insert or update objects in one transaction
+        """
+        table = self.table(cls)
+        columns = ["id", "data"] + [_quote(attr) for attr in cls.INDEXES]
+        rows = []
+        for obj in objs:
+            values = [obj.id, obj.to_json_text()]
+            values += [_sql_value(getattr(obj, attr, None))
+                       for attr in cls.INDEXES]
+            rows.append(values)
+        updates = ", ".join("{0} = excluded.{0}".format(c)
+                            for c in columns[1:])
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT INTO {} ({}) VALUES ({}) "
+                "ON CONFLICT(id) DO UPDATE SET {}".format(
+                    table, ", ".join(columns),
+                    ", ".join("?" for _ in columns), updates), rows)
+            cache = self.cache(cls)
+            for obj in objs:
+                cache.put(obj)
+
+    def delete(self, obj: TypeVar('Base')) -> bool:
+        """ Remove an object in one transaction
+        """
+        return self.delete_many(obj.__class__, [obj.id]) > 0
+
+    def delete_many(self, cls, ids: List[str]) -> int:
+        """ Remove the objects with these IDs in one transaction, return
+            how many were stored
+        """
+        table = self.table(cls)
+        with self.lock, self.connection:
+            cursor = self.connection.executemany(
+                "DELETE FROM {} WHERE id = ?".format(table),
+                [(obj_id,) for obj_id in ids])
+            cache = self.cache(cls)
+            for obj_id in ids:
+                cache.discard(obj_id)
+        return cursor.rowcount
+
+    def count(self, cls, query: Query = None) -> int:
+        """ Count all objects of a class, or the ones matching a query
+        """
+        table = self.table(cls)
+        where, params = self._where(cls, query or Query())
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT COUNT(*) FROM {}{}".format(table, where),
+                params).fetchone()
+        return row[0]
+
+    def get(self, cls, id: str) -> TypeVar('Base'):
+        """ Return one object by ID
+        """
+        table = self.table(cls)
+        with self.lock:
+            self._validate()
+            obj = self.cache(cls).get(id)
+            if obj is not None:
+                return obj
+            row = self.connection.execute(
+                "SELECT id, data FROM {} WHERE id = ?".format(table),
+                (id,)).fetchone()
+            if row is None:
+                return None
+            return self._build(cls, row)
+
+    def search(self, cls, attributes: dict) -> List[TypeVar('Base')]:
+        """ Search all objects with matching attributes
+        """
+        table = self.table(cls)
+        where, params = self._where(cls, Query(attributes))
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT id, data FROM {}{} ORDER BY rowid".format(
+                    table, where), params).fetchall()
+            return [self._build(cls, row) for row in rows]
+
+    def query(self, cls, query: Query) -> Iterator:
+        """ Iterate over the objects matching a query, or their fields,
+            running it in SQL and reading PAGE_SIZE rows at a time
+            Each page starts after the last row of the previous one, by
+            its sort values, so that objects removed or saved while
+            iterating don't move the rows not read yet.
+        """
+        table = self.table(cls)
+        where, params = self._where(cls, query)
+        order, order_params = self._order(cls, query)
+        keys = []
+        key_params = []
+        for attribute, _ in query.order_by:
+            column, column_params = self._column(cls, attribute)
+            keys.append(column)
+            key_params.extend(column_params)
+        sql = "SELECT {} FROM {}{{}}{} LIMIT ? OFFSET ?".format(
+            ", ".join(["id", "data"] + keys + ["rowid"]), table, order)
+        offset = query.offset
+        left = query.limit
+        after, after_params = "", []
+        while left is None or left > 0:
+            size = PAGE_SIZE if left is None else min(PAGE_SIZE, left)
+            with self.lock:
+                rows = self.connection.execute(
+                    sql.format(where + after),
+                    key_params + params + after_params + order_params +
+                    [size, offset]).fetchall()
+                if query.fields is not None:
+                    page = [query.project(json.loads(row[1]))
+                            for row in rows]
+                else:
+                    page = [self._build(cls, row) for row in rows]
+            yield from page
+            if len(rows) < size:
+                return
+            after, after_params = self._after(cls, query, rows[-1][2:])
+            after = (" AND " if where else " WHERE ") + after
+            offset = 0
+            if left is not None:
+                left -= size
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+""" Storage module
+"""
+from typing import TypeVar, Iterator, List
+from models.query import Query
+
+
+class Storage():
+    """ Storage backend of the Base models
+
+        Every method receives the model class or object it works on,
+        so that one backend instance serves all the model classes.
+    """
+
+    def load(self, cls):
+        """ Load (or open) the objects of a class
+        """
+        raise NotImplementedError
+
+    def save_all(self, cls):
+        """ Make every object of a class durable
+        """
+        raise NotImplementedError
+
+    def flush(self, cls):
+        """ Write the deferred operations of a class, if any
+        """
+
+    def cache_stats(self, cls) -> dict:
+        """ Return the statistics of the object cache of a class, empty
+            if the backend keeps every object in memory
+        """
+        return {}
+
+    def put(self, obj: TypeVar('Base')):
+        """ Insert or update an object
+        """
+        raise NotImplementedError
+
+    def delete(self, obj: TypeVar('Base')) -> bool:
+        """ Remove an object, return False if it wasn't stored
+        """
+        raise NotImplementedError
+
+    def put_many(self, cls, objs: List[TypeVar('Base')]):
+        """ Insert or update objects of a class, all or none of them
+        """
+        raise NotImplementedError
+
+    def delete_many(self, cls, ids: List[str]) -> int:
+        """ Remove the objects of a class with these IDs, all or none of
+            them, return how many were stored
+        """
+        raise NotImplementedError
+
+    def count(self, cls, query: Query = None) -> int:
+        """ Count the objects of a class, or the ones matching a query
+        """
+        raise NotImplementedError
+
+    def get(self, cls, id: str) -> TypeVar('Base'):
+        """ Return one object by ID, None if not found
+        """
+        raise NotImplementedError
+
+    def search(self, cls, attributes: dict) -> List[TypeVar('Base')]:
+        """ Return the objects of a class with matching attributes
+        """
+        raise NotImplementedError
+
+    def query(self, cls, query: Query) -> Iterator:
+        """ Iterate over the objects of a class matching a query, or over
+            their fields if the query has some
+        """
+        raise NotImplementedError
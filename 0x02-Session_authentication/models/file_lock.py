@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+""" File lock module
+"""
+from contextlib import contextmanager
+from typing import Iterator
+import os
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class FileLock():
+    """ Advisory lock shared by all the processes using a lock file,
+        shared for readers and exclusive for writers
+
+        flock locks are held by the open file, not by the thread, so the
+        threads of a process must be kept apart by another lock. The file
+        is opened again in a forked child, which would share it otherwise.
+    """
+
+    def __init__(self, file_path: str):
+        """ Initialize a FileLock, the file is opened on first use
+        """
+        self.file_path = file_path
+        self.fd = None
+        self.pid = None
+
+    @contextmanager
+    def hold(self, exclusive: bool) -> Iterator[None]:
+        """ Hold the lock, exclusive or shared
+        """
+        if fcntl is None:
+            raise OSError("file locks are not supported on this platform")
+        if self.pid != os.getpid():
+            self.fd = os.open(self.file_path, os.O_RDWR | os.O_CREAT, 0o644)
+            self.pid = os.getpid()
+        fcntl.flock(self.fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
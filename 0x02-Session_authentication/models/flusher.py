@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+""" Flusher module
+"""
+from typing import Dict, Tuple
+import atexit
+import threading
+import time
+
+
+class Flusher():
+    """ Background thread coalescing the deferred writes of model classes
+
+        Each class with deferred durability has its pending operations
+        kept by object ID, so that several saves of the same object end
+        up as a single write. A class is flushed FLUSH_INTERVAL seconds
+        after its first pending operation, or as soon as it has
+        FLUSH_EVERY of them, through its flush() class method. A failed
+        flush is retried FLUSH_INTERVAL seconds later, however many
+        operations are pending.
+    """
+
+    def __init__(self):
+        """ Initialize a Flusher, its thread starts on first use
+        """
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.since = {}
+        self.retry = {}
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.thread = None
+        atexit.register(self.shutdown)
+
+    def mark(self, cls, op: str, obj):
+        """ Record a deferred 'put' or 'delete' of an object
+        """
+        self.mark_many(cls, {obj.id: (op, obj)})
+
+    def mark_many(self, cls, new_ops: Dict[str, Tuple[str, object]]):
+        """ Record deferred operations, given as {id: (op, obj)}
+        """
+        with self.lock:
+            ops = self.pending.setdefault(cls, {})
+            ops.update(new_ops)
+            self.since.setdefault(cls, time.monotonic())
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run,
+                                               name="models-flusher",
+                                               daemon=True)
+                self.thread.start()
+            if len(ops) == 1 or len(ops) >= cls.FLUSH_EVERY:
+                self.wakeup.set()
+
+    def take(self, cls) -> Dict[str, Tuple[str, object]]:
+        """ Return and forget the pending operations of a class
+        """
+        with self.lock:
+            self.since.pop(cls, None)
+            return self.pending.pop(cls, {})
+
+    def peek(self, cls) -> Dict[str, Tuple[str, object]]:
+        """ Return a copy of the pending operations of a class
+        """
+        with self.lock:
+            return dict(self.pending.get(cls, {}))
+
+    def restore(self, cls, ops: Dict[str, Tuple[str, object]]):
+        """ Put back operations whose flush failed, unless newer ones
+            were recorded meanwhile
+        """
+        with self.lock:
+            pending = self.pending.setdefault(cls, {})
+            for obj_id, op in ops.items():
+                pending.setdefault(obj_id, op)
+            self.since.setdefault(cls, time.monotonic())
+
+    def _next_due(self) -> Tuple[list, float]:
+        """ Return the classes due for a flush and the seconds until
+            the next one is due, None if nothing is pending
+        """
+        now = time.monotonic()
+        due = []
+        timeout = None
+        with self.lock:
+            for cls, since in self.since.items():
+                left = since + cls.FLUSH_INTERVAL - now
+                if cls in self.retry:
+                    left = self.retry[cls] - now
+                elif len(self.pending[cls]) >= cls.FLUSH_EVERY:
+                    left = 0
+                if left <= 0:
+                    due.append(cls)
+                elif timeout is None or left < timeout:
+                    timeout = left
+        return due, timeout
+
+    def _run(self):
+        """ Flush the classes as they become due
+        """
+        while not self.stopping:
+            due, timeout = self._next_due()
+            for cls in due:
+                try:
+                    cls.flush()
+                except Exception:
+                    # Operations are restored, retry after FLUSH_INTERVAL
+                    with self.lock:
+                        self.retry[cls] = (time.monotonic() +
+                                           cls.FLUSH_INTERVAL)
+                else:
+                    with self.lock:
+                        self.retry.pop(cls, None)
+            if due:
+                continue
+            self.wakeup.wait(timeout)
+            self.wakeup.clear()
+
+    def flush_all(self):
+        """ Flush every class with pending operations
+        """
+        with self.lock:
+            classes = list(self.pending.keys())
+        for cls in classes:
+            cls.flush()
+
+    def shutdown(self):
+        """ Stop the thread and flush what is left, run at exit
+        """
+        self.stopping = True
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush_all()
+
+
+FLUSHER = Flusher()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+""" Index module
+"""
+from bisect import bisect_left, bisect_right
+from typing import TypeVar, List
+from models.query import prefix_end
+
+
+class Index():
+    """ Secondary index of one attribute: value -> {id: object}
+
+        The values are also kept sorted, from the first range or ordered
+        lookup after a value was added or removed, when they can be
+        compared with each other.
+    """
+
+    def __init__(self, attribute: str):
+        """ Initialize an empty Index
+        """
+        self.attribute = attribute
+        self.buckets = {}
+        self.values = {}
+        self.sorted = None
+
+    def add(self, obj: TypeVar('Base')):
+        """ Index an object under the current value of the attribute
+        """
+        self.put(obj.id, getattr(obj, self.attribute, None), obj)
+
+    def put(self, obj_id: str, value, obj):
+        """ Index obj, an object or its raw JSON, under value
+        """
+        self.discard(obj_id)
+        try:
+            bucket = self.buckets.get(value)
+        except TypeError:
+            # Unhashable values are only found by a full scan
+            return
+        if bucket is None:
+            bucket = self.buckets[value] = {}
+            self.sorted = None
+        bucket[obj_id] = obj
+        self.values[obj_id] = value
+
+    def discard(self, obj_id: str):
+        """ Remove an object from the index
+        """
+        if obj_id not in self.values:
+            return
+        value = self.values.pop(obj_id)
+        bucket = self.buckets[value]
+        del bucket[obj_id]
+        if len(bucket) == 0:
+            del self.buckets[value]
+            self.sorted = None
+
+    def lookup(self, value) -> dict:
+        """ Return the objects indexed under a value, by ID
+            Raise TypeError if the value can't be indexed
+        """
+        return self.buckets.get(value, {})
+
+    def build(self, entries):
+        """ Replace the content of the index with entries, each
+            (obj_id, value, obj), faster than a put per object
+        """
+        self.clear()
+        buckets = self.buckets
+        values = self.values
+        for obj_id, value, obj in entries:
+            try:
+                bucket = buckets.get(value)
+            except TypeError:
+                continue
+            if bucket is None:
+                bucket = buckets[value] = {}
+            bucket[obj_id] = obj
+            values[obj_id] = value
+        self.sorted = None
+
+    def clear(self):
+        """ Remove every object from the index
+        """
+        self.buckets = {}
+        self.values = {}
+        self.sorted = None
+
+    def sorted_values(self) -> List:
+        """ Return the indexed values but None, sorted
+            Raise TypeError if they can't be compared
+        """
+        if self.sorted is None:
+            self.sorted = sorted(value for value in self.buckets
+                                 if value is not None)
+        return self.sorted
+
+    def select(self, op: str, value) -> dict:
+        """ Return the objects whose value satisfies an operator of
+            models.query.OPERATORS, by ID, or None if the index can't
+            tell ('ne')
+            Raise TypeError if the value can't be looked up
+        """
+        if op == 'eq':
+            return dict(self.lookup(value))
+        if op == 'in':
+            objs = {}
+            for one in value:
+                objs.update(self.lookup(one))
+            return objs
+        if op == 'ne' or value is None:
+            return None if op == 'ne' else {}
+        values = self.sorted_values()
+        if op == 'startswith':
+            if not isinstance(value, str):
+                return {}
+            end = prefix_end(value)
+            start = bisect_left(values, value)
+            stop = len(values) if end is None else bisect_left(values, end)
+        elif op in ('gt', 'gte'):
+            start = (bisect_right if op == 'gt' else bisect_left)(values,
+                                                                  value)
+            stop = len(values)
+        else:
+            start = 0
+            stop = (bisect_left if op == 'lt' else bisect_right)(values,
+                                                                 value)
+        objs = {}
+        for one in values[start:stop]:
+            objs.update(self.buckets[one])
+        return objs
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+""" Journal module
+"""
+from typing import Callable, List, Tuple, Union
+import json
+import os
+import threading
+
+
+def write_atomic(file_path: str, content):
+    """ Write a str or bytes content through a synced temporary file and
+        a rename, so that readers and crashes only ever see a complete file
+    """
+    tmp_path = "{}.tmp{}".format(file_path, os.getpid())
+    with open(tmp_path, 'wb' if type(content) is bytes else 'w') as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+    _fsync_dir(file_path)
+
+
+def _fsync_dir(file_path: str):
+    """ Make a rename in the directory of file_path durable
+    """
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(file_path)),
+                     os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class Journal():
+    """ Append-only log of the put/delete operations of one model class
+
+        Each line is a JSON entry {"op": "put", "id": ..., "obj": {...}}
+        or {"op": "delete", "id": ...}, or a batch of entries applied all
+        or none {"op": "batch", "entries": [...]}. Once the log grows past
+        a size threshold it is rotated to <journal>.1 and compacted in the
+        background into the JSON snapshot, after which <journal>.1 is
+        removed. Replaying the snapshot, <journal>.1 and the journal in
+        this order gives back the latest state even after a crash.
+        serialize, if given, converts each object to its JSON text instead
+        of to_json(True), and on_snapshot is called with the
+        objects of each snapshot right after it is written.
+    """
+
+    def __init__(self, file_path: str, snapshot_path: str,
+                 serialize: Callable[[object], str] = None,
+                 on_snapshot: Callable[[dict], None] = None):
+        """ Initialize a Journal
+        """
+        self.file_path = file_path
+        self.rotated_path = file_path + ".1"
+        self.snapshot_path = snapshot_path
+        self.serialize = serialize
+        self.on_snapshot = on_snapshot
+        self.lock = threading.RLock()
+        self.generation = 0
+        self._compaction = None
+
+    def append(self, entries: List[Union[dict, str]]) -> int:
+        """ Durably append entries, dictionaries or their JSON text on a
+            single line, return the size of the journal
+        """
+        data = "".join((entry if isinstance(entry, str)
+                        else json.dumps(entry)) + "\n" for entry in entries)
+        data = data.encode('utf-8')
+        with self.lock:
+            fd = os.open(self.file_path,
+                         os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view):]
+                os.fsync(fd)
+                return os.fstat(fd).st_size
+            finally:
+                os.close(fd)
+
+    def replay(self) -> List[dict]:
+        """ Return every entry of <journal>.1 then of the journal
+            A torn last line, left by a crash while appending, is dropped
+            and cut from the file
+        """
+        with self.lock:
+            entries = self._read(self.rotated_path)
+            entries.extend(self._read(self.file_path))
+        return entries
+
+    @staticmethod
+    def entries(file_path: str, offset: int = 0) -> Tuple[List[dict], int]:
+        """ Return the complete entries of one journal file from offset,
+            and the offset following the last of them
+        """
+        entries = []
+        if not os.path.exists(file_path):
+            return entries, offset
+        with open(file_path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if entry.get('op') == 'batch':
+                    entries.extend(entry['entries'])
+                else:
+                    entries.append(entry)
+                offset += len(line)
+        return entries, offset
+
+    @classmethod
+    def _read(cls, file_path: str) -> List[dict]:
+        """ Read the complete entries of one journal file
+        """
+        if not os.path.exists(file_path):
+            return []
+        entries, good = cls.entries(file_path)
+        if good < os.path.getsize(file_path):
+            with open(file_path, 'r+b') as f:
+                f.truncate(good)
+                os.fsync(f.fileno())
+        return entries
+
+    def reset(self):
+        """ Forget every entry, once the snapshot holds them all
+        """
+        with self.lock:
+            self.generation += 1
+            for file_path in (self.rotated_path, self.file_path):
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+
+    def compact(self, objs: Callable[[], dict]) -> bool:
+        """ Rotate the journal and write objs() as the new snapshot from a
+            background thread. objs() maps IDs to objects, or to their raw
+            JSON, and must hold every operation logged so far: it is
+            called with the journal lock held, so that no entry can be
+            appended between the copy and the rotation
+            Return False if a compaction is already running
+        """
+        with self.lock:
+            if self._compaction is not None and self._compaction.is_alive():
+                return False
+            objs = dict(objs())
+            if os.path.exists(self.rotated_path):
+                # A previous compaction did not finish: keep its entries
+                with open(self.file_path, 'rb') as src, \
+                        open(self.rotated_path, 'ab') as dst:
+                    dst.write(src.read())
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                os.remove(self.file_path)
+            else:
+                os.replace(self.file_path, self.rotated_path)
+            _fsync_dir(self.file_path)
+            self._compaction = threading.Thread(
+                target=self._write_snapshot,
+                args=(objs, self.generation), daemon=True)
+            self._compaction.start()
+        return True
+
+    def _write_snapshot(self, objs: dict, generation: int):
+        """ Write the snapshot then drop the rotated journal
+        """
+        serialize = self.serialize
+        if serialize is None:
+            def serialize(obj):
+                return json.dumps(obj if type(obj) is dict
+                                  else obj.to_json(True))
+        content = "{" + ", ".join(json.dumps(obj_id) + ": " + serialize(obj)
+                                  for obj_id, obj in objs.items()) + "}"
+        with self.lock:
+            if generation != self.generation:
+                # The snapshot was rewritten meanwhile, this one is stale
+                return
+            write_atomic(self.snapshot_path, content)
+            if self.on_snapshot is not None:
+                self.on_snapshot(objs)
+            if os.path.exists(self.rotated_path):
+                os.remove(self.rotated_path)
+
+    def wait(self):
+        """ Wait for the running compaction, if any
+        """
+        compaction = self._compaction
+        if compaction is not None:
+            compaction.join()
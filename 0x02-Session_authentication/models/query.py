@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+""" Query module
+"""
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Tuple, Union
+import operator
+
+
+def _startswith(value, prefix) -> bool:
+    """ Tell if a string starts with prefix
+    """
+    return isinstance(value, str) and value.startswith(prefix)
+
+
+def _in(value, values) -> bool:
+    """ Tell if value is one of values
+    """
+    return value in values
+
+
+OPERATORS = {
+    'eq': operator.eq,
+    'ne': operator.ne,
+    'lt': operator.lt,
+    'lte': operator.le,
+    'gt': operator.gt,
+    'gte': operator.ge,
+    'startswith': _startswith,
+    'in': _in,
+}
+
+
+def prefix_end(prefix: str) -> str:
+    """ Return the smallest string greater than every string starting
+        with prefix, None if there is none
+    """
+    while prefix and ord(prefix[-1]) == 0x10ffff:
+        prefix = prefix[:-1]
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class Query():
+    """ Filter, order, window and projection of a query on a model class
+
+        filter maps attribute names, optionally followed by "__" and an
+        operator of OPERATORS, to values: {'email__startswith': 'bob',
+        'created_at__gte': date}. A plain name tests equality. Comparisons
+        with None, or between values of different types, don't match.
+        order_by is an attribute name, or a list of them, each prefixed by
+        "-" for a descending order; None values sort last. fields, if
+        given, are the keys of to_json(True) returned for each object
+        instead of the objects themselves.
+    """
+
+    def __init__(self, filter: dict = None,
+                 order_by: Union[str, Iterable[str]] = None,
+                 limit: int = None, offset: int = 0,
+                 fields: Iterable[str] = None):
+        """ Initialize a Query
+        """
+        self.predicates = []
+        for key, value in (filter or {}).items():
+            attribute, _, op = key.rpartition('__')
+            if not attribute or op not in OPERATORS:
+                attribute, op = key, 'eq'
+            if op == 'in':
+                value = tuple(value)
+            self.predicates.append((attribute, op, value))
+        if isinstance(order_by, str):
+            order_by = [order_by]
+        self.order_by = [(name.lstrip('-'), name.startswith('-'))
+                         for name in order_by or ()]
+        if limit is not None and limit < 0:
+            raise ValueError("limit must be positive")
+        if offset < 0:
+            raise ValueError("offset must be positive")
+        self.limit = limit
+        self.offset = offset
+        self.fields = tuple(fields) if fields is not None else None
+
+    def attributes(self) -> set:
+        """ Return the names of the attributes the filter reads
+        """
+        return {attribute for attribute, _, _ in self.predicates}
+
+    def matches(self, value: Callable[[str], object]) -> bool:
+        """ Tell if an object matches the filter, value(name) returning
+            the value of each attribute
+        """
+        for attribute, op, expected in self.predicates:
+            actual = value(attribute)
+            if op in ('eq', 'ne', 'in'):
+                if not OPERATORS[op](actual, expected):
+                    return False
+                continue
+            if actual is None or expected is None:
+                return False
+            try:
+                if not OPERATORS[op](actual, expected):
+                    return False
+            except TypeError:
+                return False
+        return True
+
+    def sort(self, objs: Iterable) -> List:
+        """ Return objects sorted by order_by
+        """
+        objs = list(objs)
+        for attribute, descending in reversed(self.order_by):
+            # None last: (True, None) sorts after (False, any value)
+            objs.sort(key=lambda obj: (getattr(obj, attribute, None) is None,
+                                       getattr(obj, attribute, None)),
+                      reverse=descending)
+            if descending:
+                # reverse=True also moved None first, put it back last
+                nones = [obj for obj in objs
+                         if getattr(obj, attribute, None) is None]
+                if nones:
+                    objs = objs[len(nones):] + nones
+        return objs
+
+    def window(self, objs: Iterable) -> Iterator:
+        """ Apply offset and limit to objects
+        """
+        stop = None if self.limit is None else self.offset + self.limit
+        return islice(objs, self.offset, stop)
+
+    def project(self, obj_json: dict) -> dict:
+        """ Return the fields of a to_json(True) dictionary
+        """
+        return {field: obj_json.get(field) for field in self.fields}
+
+    def ranges(self, attribute: str) -> List[Tuple[str, object]]:
+        """ Return the (op, value) predicates on an attribute
+        """
+        return [(op, value) for name, op, value in self.predicates
+                if name == attribute]
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+""" Readers-writer lock module
+"""
+from contextlib import contextmanager
+from typing import Iterator
+import threading
+
+
+class RWLock():
+    """ Readers-writer lock: any number of readers, or a single writer
+
+        A waiting writer keeps new readers out, so that a steady flow of
+        readers can't starve it. Not reentrant: a thread holding the lock
+        must not acquire it again.
+    """
+
+    def __init__(self):
+        """ Initialize an unlocked RWLock
+        """
+        self.condition = threading.Condition(threading.Lock())
+        self.readers = 0
+        self.writing = False
+        self.writers_waiting = 0
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        """ Hold the lock shared with other readers
+        """
+        with self.condition:
+            while self.writing or self.writers_waiting:
+                self.condition.wait()
+            self.readers += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.readers -= 1
+                if self.readers == 0:
+                    self.condition.notify_all()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        """ Hold the lock alone
+        """
+        with self.condition:
+            self.writers_waiting += 1
+            try:
+                while self.writing or self.readers:
+                    self.condition.wait()
+            finally:
+                self.writers_waiting -= 1
+            self.writing = True
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.writing = False
+                self.condition.notify_all()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+""" Snapshot module
+"""
+from typing import List
+import marshal
+import os
+import struct
+import zlib
+from models.journal import write_atomic
+
+
+MAGIC = b"MDLS"
+VERSION = 1
+# Magic, version, CRC32 of the payload, then the inode, mtime (ns) and
+# size of the JSON file the snapshot was written from
+HEADER = struct.Struct(">4sHIQQQ")
+
+
+def _source_stat(source_path: str) -> tuple:
+    """ Return the (inode, mtime_ns, size) of the JSON file
+    """
+    st = os.stat(source_path)
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def write(file_path: str, source_path: str, names: tuple,
+          rows: List[tuple]) -> bool:
+    """ Write rows, each (id, created_at, updated_at, *values of names)
+        with integer timestamps, as the binary snapshot of the JSON file
+        source_path, which must be written first
+        Return False if a value can't be stored in the binary format
+    """
+    try:
+        payload = marshal.dumps((names, rows))
+    except ValueError:
+        return False
+    header = HEADER.pack(MAGIC, VERSION, zlib.crc32(payload),
+                         *_source_stat(source_path))
+    write_atomic(file_path, header + payload)
+    return True
+
+
+def read(file_path: str, source_path: str, names: tuple) -> List[tuple]:
+    """ Return the rows of a binary snapshot, or None if it is missing,
+        corrupt, of another version or attribute list, or older than the
+        JSON file source_path
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        source = _source_stat(source_path)
+    except OSError:
+        return None
+    if len(data) < HEADER.size:
+        return None
+    magic, version, crc, *stat = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION or tuple(stat) != source:
+        return None
+    payload = memoryview(data)[HEADER.size:]
+    if zlib.crc32(payload) != crc:
+        return None
+    try:
+        snapshot_names, rows = marshal.loads(payload)
+    except (EOFError, ValueError, TypeError):
+        return None
+    if tuple(snapshot_names) != tuple(names):
+        return None
+    return rows
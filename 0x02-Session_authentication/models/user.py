@@ -5,10 +5,23 @@ import hashlib
 from models.base import Base
 
 
+def email_domain(user: 'User') -> str:
+    """ Return the lowercase domain of the email of a user, None if the
+        user has no email
+    """
+    if type(user.email) is not str or '@' not in user.email:
+        return None
+    return user.email.rpartition('@')[2].lower()
+
+
 class User(Base):
     """ User class
     """
 
+    __slots__ = ('email', '_password', 'first_name', 'last_name')
+    INDEXES = ('email',)
+    AGGREGATES = {'email_domain': email_domain}
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a User instance
         """
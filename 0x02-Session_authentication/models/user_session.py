@@ -4,18 +4,51 @@
 Module for User Session Model
 """
 
+import sys
 from models.base import Base
 
 
+def session_user(user_session: 'UserSession') -> str:
+    """
+    Return the user ID of a User Session
+    """
+    return user_session.user_id
+
+
+def session_minute(user_session: 'UserSession') -> int:
+    """
+    Return the minute a User Session was created, in minutes since the
+    epoch
+    """
+    return user_session._created_at // 60
+
+
 class UserSession(Base):
     """
     User Session Model
     """
 
+    __slots__ = ('user_id', 'session_id')
+    INDEXES = ('session_id', 'user_id')
+    AGGREGATES = {'user_id': session_user, 'created_minute': session_minute}
+
     def __init__(self, *args: list, **kwargs: dict):
         """
         Initialize User Session instance
         """
         super().__init__(*args, **kwargs)
         self.user_id = kwargs.get('user_id')
+        if type(self.user_id) is str:
+            # Shared by all the sessions of a user
+            self.user_id = sys.intern(self.user_id)
         self.session_id = kwargs.get('session_id')
+
+    @classmethod
+    def from_json(cls, obj_json: dict) -> 'UserSession':
+        """
+        Build a User Session from its JSON, interning user_id as well
+        """
+        user_session = super().from_json(obj_json)
+        if type(user_session.user_id) is str:
+            user_session.user_id = sys.intern(user_session.user_id)
+        return user_session
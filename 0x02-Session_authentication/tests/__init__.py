@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+""" Tests of the models store
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from models import aggregate, base, bloom
+from models.engine import file_storage
+from models.user import User
+from models.user_session import UserSession
+
+
+class StoreTestCase(unittest.TestCase):
+    """ Test case running in an empty directory, with empty stores and
+        the default settings of the model classes
+    """
+
+    def setUp(self):
+        """ Move to a new directory and forget every stored object
+        """
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        os.chdir(self.directory)
+        for registry in (file_storage.DATA, file_storage.INDEX_DATA,
+                         file_storage.JOURNALS, file_storage.LOCKS,
+                         file_storage.SNAPSHOTS, file_storage.FILE_LOCKS,
+                         file_storage.SEEN, base.STORAGES,
+                         aggregate.AGGREGATES, bloom.BLOOM_FILTERS):
+            patcher = mock.patch.dict(registry, clear=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for cls in (User, UserSession):
+            for name, value in (('STORAGE', 'file'), ('JOURNAL', False),
+                                ('DURABILITY', 'always'),
+                                ('LAZY_LOAD', False), ('SNAPSHOT', False),
+                                ('COHERENT', False)):
+                patcher = mock.patch.object(cls, name, value)
+                patcher.start()
+                self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        """ Go back to the former directory and remove the new one
+        """
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def reload(self, cls):
+        """ Forget the objects of a class in memory and load them again
+        """
+        base.STORAGES.clear()
+        file_storage.DATA.pop(cls.__name__, None)
+        file_storage.INDEX_DATA.pop(cls.__name__, None)
+        file_storage.SNAPSHOTS.pop(cls.__name__, None)
+        file_storage.JOURNALS.pop(cls.__name__, None)
+        cls.load_from_file()
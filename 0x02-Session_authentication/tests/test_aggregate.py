@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+""" Tests of the aggregates of the model classes
+"""
+from models.user_session import UserSession
+from tests import StoreTestCase
+
+
+class TestAggregates(StoreTestCase):
+    """ Aggregates are only kept where they see every change
+    """
+
+    def test_counts(self):
+        """ Saves and removes are counted
+        """
+        UserSession.load_from_file()
+        sessions = [UserSession(user_id=str(i % 2)) for i in range(5)]
+        UserSession.save_many(sessions)
+        sessions[0].remove()
+        self.assertEqual(dict(UserSession.aggregate('user_id').counts),
+                         {'0': 2, '1': 2})
+
+    def test_coherent(self):
+        """ In COHERENT mode, where other processes write too, there are
+            none
+        """
+        UserSession.COHERENT = True
+        UserSession.load_from_file()
+        UserSession(user_id="1").save()
+        with self.assertRaises(ValueError):
+            UserSession.aggregate('user_id')
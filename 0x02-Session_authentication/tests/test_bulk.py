@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+""" Tests of the bulk saves and removes
+"""
+from unittest import mock
+from models.journal import Journal
+from models.user import User
+from tests import StoreTestCase
+
+
+class TestBulkRollback(StoreTestCase):
+    """ save_many and remove_many keep nothing when they can't write
+    """
+
+    def setUp(self):
+        """ Store 10 users
+        """
+        super().setUp()
+        User.load_from_file()
+        self.users = [User(email="user{}@x".format(i)) for i in range(10)]
+        User.save_many(self.users)
+
+    def assertUnchanged(self):
+        """ Check that the 10 users are stored, in memory and on file
+        """
+        for _ in range(2):
+            self.assertEqual(User.count(), 10)
+            self.assertEqual(User.search({'email': "new@x"}), [])
+            self.assertEqual(User.search({'email': "user5@x"}),
+                             [self.users[5]])
+            self.reload(User)
+
+    def test_save_many_rollback(self):
+        """ A failed save_many keeps none of the objects
+        """
+        with mock.patch('models.engine.file_storage.write_atomic',
+                        side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                User.save_many([User(email="new@x"), User(email="new2@x")])
+        self.assertUnchanged()
+
+    def test_remove_many_rollback(self):
+        """ A failed remove_many removes none of the objects
+        """
+        with mock.patch('models.engine.file_storage.write_atomic',
+                        side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                User.remove_many(self.users[3:7])
+        self.assertUnchanged()
+
+    def test_journal_rollback(self):
+        """ A save_many whose journal entry can't be written keeps none
+            of the objects
+        """
+        User.JOURNAL = True
+        with mock.patch.object(Journal, 'append',
+                               side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                User.save_many([User(email="new@x"), User(email="new2@x")])
+            with self.assertRaises(OSError):
+                User.remove_many([user.id for user in self.users[:5]])
+        self.assertUnchanged()
+
+    def test_wrong_type(self):
+        """ Nothing is saved when an item is not a User
+        """
+        with self.assertRaises(TypeError):
+            User.save_many([User(email="new@x"), "user"])
+        with self.assertRaises(TypeError):
+            User.remove_many([self.users[0], 1])
+        self.assertUnchanged()
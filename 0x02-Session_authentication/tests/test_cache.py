@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+""" Tests of the object cache of the sqlite storage
+"""
+from models.engine.sqlite_storage import SQLiteStorage
+from models.user import User
+from tests import StoreTestCase
+
+
+class TestSharedDatabase(StoreTestCase):
+    """ The cache of a process sees the writes of other processes
+    """
+
+    def setUp(self):
+        """ Open the same database twice, store two users through the
+            first connection and cache them
+        """
+        super().setUp()
+        self.storage = SQLiteStorage(".db.sqlite3")
+        self.other = SQLiteStorage(".db.sqlite3")
+        self.removed = User(email="removed@x")
+        self.changed = User(email="b@x")
+        self.storage.put_many(User, [self.removed, self.changed])
+        for user in (self.removed, self.changed):
+            self.assertIs(self.storage.get(User, user.id), user)
+
+    def test_get_removed(self):
+        """ An object removed by another connection is not returned
+        """
+        self.other.delete_many(User, [self.removed.id])
+        self.assertIsNone(self.storage.get(User, self.removed.id))
+
+    def test_changed(self):
+        """ search and get return the values saved by another connection
+        """
+        changed = self.other.get(User, self.changed.id)
+        changed.email = "changed@x"
+        self.other.put(changed)
+        found = self.storage.search(User, {'email': "changed@x"})
+        self.assertEqual([user.email for user in found], ["changed@x"])
+        self.assertEqual(self.storage.get(User, self.changed.id).email,
+                         "changed@x")
+
+    def test_own_writes_cached(self):
+        """ Objects saved through the connection stay cached
+        """
+        self.storage.put(self.changed)
+        self.assertIs(self.storage.get(User, self.changed.id), self.changed)
+        self.assertGreater(self.storage.cache_stats(User)['hits'], 0)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+""" Tests of the journal and its replay
+"""
+import os
+from models.journal import Journal
+from models.user import User
+from tests import StoreTestCase
+
+
+class TestJournal(StoreTestCase):
+    """ Journal replay and crash recovery
+    """
+
+    def test_torn_tail_truncated(self):
+        """ A torn last line is dropped and cut from the file
+        """
+        journal = Journal(".journal", ".snapshot")
+        journal.append([{'op': 'put', 'id': '1', 'obj': {'id': '1'}},
+                        {'op': 'delete', 'id': '2'}])
+        good = os.path.getsize(".journal")
+        with open(".journal", 'a') as f:
+            f.write('{"op": "put", "id": "3", "ob')
+        self.assertEqual([entry['id'] for entry in journal.replay()],
+                         ['1', '2'])
+        self.assertEqual(os.path.getsize(".journal"), good)
+        journal.append([{'op': 'delete', 'id': '4'}])
+        self.assertEqual([entry['id'] for entry in journal.replay()],
+                         ['1', '2', '4'])
+
+    def test_torn_batch_dropped(self):
+        """ A batch torn by a crash is dropped as a whole on load
+        """
+        User.JOURNAL = True
+        User.load_from_file()
+        User.save_many([User(email="kept{}@x".format(i)) for i in range(5)])
+        good = os.path.getsize(".db_User.journal")
+        User.save_many([User(email="torn{}@x".format(i)) for i in range(5)])
+        with open(".db_User.journal", 'r+b') as f:
+            f.truncate((good + os.path.getsize(".db_User.journal")) // 2)
+        self.reload(User)
+        self.assertEqual(User.count({'email__startswith': 'kept'}), 5)
+        self.assertEqual(User.count({'email__startswith': 'torn'}), 0)
+        self.assertEqual(os.path.getsize(".db_User.journal"), good)
+
+    def test_replay_rotated_then_journal(self):
+        """ Entries of <journal>.1 are replayed before the journal
+        """
+        journal = Journal(".journal", ".snapshot")
+        journal.append([{'op': 'put', 'id': '1', 'obj': {'n': 1}}])
+        os.replace(".journal", ".journal.1")
+        journal.append([{'op': 'put', 'id': '1', 'obj': {'n': 2}}])
+        self.assertEqual([entry['obj']['n'] for entry in journal.replay()],
+                         [1, 2])
+
+    def test_load_after_interrupted_compaction(self):
+        """ The snapshot, <journal>.1 and the journal give back the latest
+            objects when a compaction did not write its snapshot
+        """
+        User.JOURNAL = True
+        User.load_from_file()
+        first, second = User(email="first@x"), User(email="second@x")
+        User.save_many([first, second])
+        User.save_to_file()
+        changed = User(email="changed@x")
+        changed.save()
+        # Rotated, then the process died before writing the snapshot
+        os.replace(".db_User.journal", ".db_User.journal.1")
+        changed.email = "changed-again@x"
+        changed.save()
+        second.remove()
+        third = User(email="third@x")
+        third.save()
+        self.reload(User)
+        self.assertEqual(sorted(user.email for user in User.all()),
+                         ["changed-again@x", "first@x", "third@x"])
+        self.assertEqual(User.get(changed.id).email, "changed-again@x")
+        self.assertIsNone(User.get(second.id))
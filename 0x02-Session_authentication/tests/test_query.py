@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+""" Tests of queries on the storage backends
+"""
+from datetime import datetime, timedelta
+from unittest import mock
+import random
+from models.engine import sqlite_storage
+from models.engine.file_storage import FileStorage
+from models.engine.sqlite_storage import SQLiteStorage
+from models.query import Query
+from models.user import User
+from models.user_session import UserSession
+from tests import StoreTestCase
+
+
+class TestQueryBackends(StoreTestCase):
+    """ The file and sqlite storages answer queries alike
+    """
+
+    QUERIES = [
+        {'filter': {'email__startswith': 'b'}},
+        {'filter': {'email__startswith': 'bob'}, 'order_by': 'email'},
+        {'filter': {'email': None}},
+        {'filter': {'email__ne': None}, 'order_by': '-email', 'limit': 10,
+         'offset': 5},
+        {'filter': {'first_name__in': ['Ann', None]},
+         'order_by': ['first_name', '-email']},
+        {'filter': {'email__gt': 'a100@x', 'email__lte': 'b200@y'}},
+        {'filter': {'created_at__gte': datetime(2020, 1, 20)},
+         'order_by': ['created_at', 'email']},
+        {'order_by': 'email', 'limit': 7},
+        {'order_by': '-email', 'limit': 7, 'offset': 290},
+        {'order_by': ['last_name', 'first_name', 'email']},
+        {'filter': {'first_name__lt': 'C'}, 'fields': ['email', 'first_name'],
+         'order_by': 'email'},
+        {'filter': {'email__in': []}},
+        {},
+    ]
+
+    def setUp(self):
+        """ Store the same 300 users in both storages
+        """
+        super().setUp()
+        rng = random.Random(1)
+        self.file = FileStorage()
+        self.sqlite = SQLiteStorage(':memory:')
+        self.users = []
+        for i in range(300):
+            user = User(email=rng.choice([None, "a{:03d}@x".format(i),
+                                          "b{:03d}@y".format(i),
+                                          "bob{}@z".format(i % 7)]),
+                        first_name=rng.choice([None, "Ann", "Bob", "Cy"]),
+                        last_name=rng.choice(["X", "Y", None]))
+            user.created_at = datetime(2020, 1, 1) + timedelta(days=i % 40)
+            self.users.append(user)
+        User.save_many(self.users)
+        self.sqlite.put_many(User, self.users)
+
+    @staticmethod
+    def keys(results: list) -> list:
+        """ Return the IDs of objects, or the projected dictionaries
+        """
+        return [result if isinstance(result, dict) else result.id
+                for result in results]
+
+    def test_same_results(self):
+        """ Both storages return the same objects, in the same order when
+            the query has one
+        """
+        for arguments in self.QUERIES:
+            with self.subTest(**arguments):
+                query = Query(**arguments)
+                on_file = self.keys(self.file.query(User, query))
+                on_sqlite = self.keys(self.sqlite.query(User, query))
+                if 'order_by' in arguments:
+                    self.assertEqual(on_file, on_sqlite)
+                else:
+                    self.assertEqual(sorted(map(str, on_file)),
+                                     sorted(map(str, on_sqlite)))
+                if 'limit' not in arguments:
+                    self.assertEqual(self.file.count(User, query),
+                                     len(on_file))
+                    self.assertEqual(self.sqlite.count(User, query),
+                                     len(on_sqlite))
+
+    def test_reference(self):
+        """ Ordering, offset and limit match a plain Python sort
+        """
+        expected = sorted((user for user in self.users
+                           if user.email is not None),
+                          key=lambda user: user.email, reverse=True)[5:15]
+        query = Query({'email__ne': None}, '-email', 10, 5)
+        for storage in (self.file, self.sqlite):
+            self.assertEqual(self.keys(storage.query(User, query)),
+                             [user.id for user in expected])
+
+    def test_small_pages(self):
+        """ The sqlite storage returns the same objects when read a few
+            rows at a time
+        """
+        for arguments in self.QUERIES:
+            with self.subTest(**arguments):
+                query = Query(**arguments)
+                expected = self.keys(self.sqlite.query(User, query))
+                with mock.patch.object(sqlite_storage, 'PAGE_SIZE', 7):
+                    self.assertEqual(
+                        self.keys(self.sqlite.query(User, query)), expected)
+
+
+class TestRemoveWhileIterating(StoreTestCase):
+    """ Removing the objects of a query while iterating over it
+    """
+
+    def test_remove_all(self):
+        """ Every session is found and removed, on both storages
+        """
+        UserSession.JOURNAL = True
+        for storage in ('file', 'sqlite'):
+            for order_by in (None, 'user_id', '-user_id'):
+                with self.subTest(storage=storage, order_by=order_by):
+                    UserSession.STORAGE = storage
+                    UserSession.load_from_file()
+                    UserSession.save_many([
+                        UserSession(user_id=str(i % 3) if i % 4 else None,
+                                    session_id=str(i))
+                        for i in range(2000)])
+                    removed = 0
+                    for user_session in UserSession.query(
+                            order_by=order_by):
+                        user_session.remove()
+                        removed += 1
+                    self.assertEqual(removed, 2000)
+                    self.assertEqual(UserSession.count(), 0)
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+""" Tests of the order of concurrent writes
+"""
+import threading
+import time
+from unittest import mock
+from models.flusher import FLUSHER
+from models.journal import Journal
+from models.user import User
+from tests import StoreTestCase
+
+
+class TestWriteOrder(StoreTestCase):
+    """ The files get the changes in the order they were made in memory
+    """
+
+    def save_while_removing(self, target, name: str):
+        """ Save a user in a thread slowed down in target.name for the
+            put, remove it meanwhile, and return the user
+        """
+        User.load_from_file()
+        user = User(email="raced@x")
+        user.save()
+        writing = threading.Event()
+        write = getattr(target, name)
+
+        def slow_write(*args):
+            """ Wait in the write of a put until the remove is started
+            """
+            if 'put' in str(args):
+                writing.set()
+                time.sleep(0.2)
+            return write(*args)
+
+        with mock.patch.object(target, name, slow_write):
+            saving = threading.Thread(target=user.save)
+            saving.start()
+            writing.wait(5)
+            user.remove()
+            saving.join()
+        return user
+
+    def test_journal(self):
+        """ A remove doesn't get in the journal before the save it
+            follows in memory
+        """
+        User.JOURNAL = True
+        user = self.save_while_removing(Journal, 'append')
+        self.assertIsNone(User.get(user.id))
+        self.reload(User)
+        self.assertIsNone(User.get(user.id))
+
+    def test_deferred(self):
+        """ A remove doesn't get marked before the save it follows in
+            memory
+        """
+        User.JOURNAL = True
+        User.DURABILITY = 'deferred'
+        user = self.save_while_removing(FLUSHER, 'mark_many')
+        FLUSHER.flush_all()
+        self.assertIsNone(User.get(user.id))
+        self.reload(User)
+        self.assertIsNone(User.get(user.id))